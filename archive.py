@@ -0,0 +1,880 @@
+"""
+Streaming archive builders for SecureShare Pro
+"""
+
+import bisect
+import collections
+import io
+import mimetypes
+import multiprocessing
+import multiprocessing.util
+import os
+import queue
+import struct
+import tarfile
+import threading
+import time
+import zlib
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import config
+
+try:
+    import zstandard
+    ZSTD_OK = True
+except ImportError:
+    ZSTD_OK = False
+
+
+# ZIP record signatures
+LOCAL_HEADER_SIG = 0x04034b50
+DATA_DESCRIPTOR_SIG = 0x08074b50
+CENTRAL_HEADER_SIG = 0x02014b50
+ZIP64_END_SIG = 0x06064b50
+ZIP64_LOCATOR_SIG = 0x07064b50
+END_SIG = 0x06054b50
+
+# General purpose flags
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+ZIP64_EXTRA_ID = 0x0001
+ZIP32_MAX = 0xFFFFFFFF
+ZIP16_MAX = 0xFFFF
+
+# Download formats: name -> (MIME type, file extension)
+ARCHIVE_FORMATS = {
+    'zip': ('application/zip', '.zip'),
+    'tar': ('application/x-tar', '.tar'),
+    'tar.gz': ('application/gzip', '.tar.gz'),
+    'tar.zst': ('application/zstd', '.tar.zst'),
+}
+TAR_COMPRESSION = {'tar': None, 'tar.gz': 'gzip', 'tar.zst': 'zstd'}
+
+# Formats that are already compressed; deflating them only burns CPU
+INCOMPRESSIBLE_EXTENSIONS = frozenset({
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.heif', '.avif',
+    '.mp4', '.m4v', '.mkv', '.mov', '.avi', '.webm', '.wmv', '.flv',
+    '.mp3', '.m4a', '.aac', '.ogg', '.opus', '.flac', '.wma',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.rar', '.lz4',
+    '.pdf', '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp', '.epub',
+    '.jar', '.apk', '.ipa', '.dmg', '.iso', '.msi',
+})
+INCOMPRESSIBLE_MIME_PREFIXES = ('image/', 'video/', 'audio/')
+# Media types that are stored raw and therefore compress well
+COMPRESSIBLE_MIME_TYPES = frozenset({
+    'image/bmp', 'image/x-ms-bmp', 'image/svg+xml', 'image/tiff',
+    'audio/wav', 'audio/x-wav',
+})
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+# How the pool fails: processes that cannot be spawned (OSError, or an
+# AssertionError inside a daemonic process), a broken or shut-down pool
+# (RuntimeError, which includes BrokenProcessPool)
+POOL_ERRORS = (OSError, RuntimeError, AssertionError)
+
+# CRC-32 of whole files keyed by (path, inode, size, mtime_ns); LRU,
+# bounded by ZIP_CRC_CACHE_SIZE
+_crc_cache = collections.OrderedDict()
+_crc_lock = threading.Lock()
+
+# Pools inherited by forked children: their manager threads and workers
+# belong to the parent, so they are kept unused rather than shut down
+_inherited_pools = []
+
+
+def _after_fork():
+    global _pool, _pool_workers, _pool_lock, _crc_lock
+    if _pool is not None:
+        _inherited_pools.append(_pool)
+    _pool = None
+    _pool_workers = 0
+    # Another thread of the parent may have held these at the fork
+    _pool_lock = threading.Lock()
+    _crc_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def get_compression_pool(workers):
+    """Return the shared process pool used to deflate archive blocks"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            # spawn keeps workers clear of the GUI and server threads
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _pool_workers = workers
+            if multiprocessing.parent_process() is not None:
+                # A multiprocessing child (a share worker) joins its own
+                # children before executors are shut down on exit, which
+                # would wait on the pool forever.  This runs first, ahead
+                # of the finalizers closing the pool's queues (priority 10).
+                multiprocessing.util.Finalize(
+                    None, shutdown_compression_pool, exitpriority=20)
+        return _pool
+
+
+def discard_compression_pool(pool):
+    """Drop ``pool`` if it is still the shared one (it broke), so the next
+    archive starts a fresh pool"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not pool:
+            return
+        _pool, _pool_workers = None, 0
+    # Blocks other archives already queued still complete if they can
+    pool.shutdown(wait=False)
+
+
+def shutdown_compression_pool():
+    """Stop the compression pool's processes, if there is a pool"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        pool, _pool, _pool_workers = _pool, None, 0
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def deflate_block(data, level, last):
+    """Compress one block into a raw deflate fragment.
+
+    Fragments from consecutive blocks can be concatenated: every block but
+    the last ends on a byte-aligned sync flush, and the last one carries the
+    final-block bit.  Runs in the worker processes.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(data)
+    return data + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def available_formats():
+    """Archive formats that can be produced with the installed libraries"""
+    return [fmt for fmt in ARCHIVE_FORMATS if fmt != 'tar.zst' or ZSTD_OK]
+
+
+def dos_datetime(mtime):
+    """Convert a POSIX timestamp to the (time, date) pair used by ZIP"""
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+class ZipMember:
+    """A single file entry of a streamed ZIP archive"""
+
+    def __init__(self, path, arcname=None):
+        self.path = path
+        self.arcname = arcname or os.path.basename(path)
+        st = os.stat(path)
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.mtime_ns = st.st_mtime_ns
+        self.inode = st.st_ino
+        self.method = None
+        self.level = None
+
+        # Filled in while streaming
+        self.crc = 0
+        self.compress_size = 0
+        self.offset = 0
+
+    @property
+    def encoded_name(self):
+        try:
+            return self.arcname.encode('ascii'), 0
+        except UnicodeEncodeError:
+            return self.arcname.encode('utf-8'), FLAG_UTF8
+
+    @property
+    def identity(self):
+        """Key that changes whenever the file is replaced or modified"""
+        return (os.path.abspath(self.path), self.inode, self.size, self.mtime_ns)
+
+    @property
+    def zip64(self):
+        # Same safety margin zipfile uses: deflate can grow incompressible data
+        return self.size * 1.05 > zipfile.ZIP64_LIMIT
+
+
+class CompressionPolicy:
+    """Choose STORED or DEFLATED, and a deflate level, for each member.
+
+    The decision is made from the file extension and MIME type first, then
+    from a quick trial compression of the first block for anything the
+    name does not settle.  Tiny files are stored, and very large files are
+    deflated at a fast level so the archive keeps up with the network.
+    """
+
+    def __init__(self, level=None, min_size=None, probe_size=None,
+                 probe_ratio=None, fast_size=None):
+        self.level = config.ZIP_COMPRESSION_LEVEL if level is None else level
+        self.min_size = config.ZIP_MIN_DEFLATE_SIZE if min_size is None else min_size
+        self.probe_size = probe_size or config.ZIP_PROBE_SIZE
+        self.probe_ratio = probe_ratio or config.ZIP_PROBE_RATIO
+        self.fast_size = fast_size or config.ZIP_FAST_LEVEL_SIZE
+
+    def choose(self, path, size):
+        """Return ``(method, level)`` for the file at ``path``"""
+        if size < self.min_size or self.level == 0:
+            return zipfile.ZIP_STORED, 0
+        if self.is_incompressible_type(path):
+            return zipfile.ZIP_STORED, 0
+        if not self.probe(path):
+            return zipfile.ZIP_STORED, 0
+        if size >= self.fast_size:
+            return zipfile.ZIP_DEFLATED, 1
+        return zipfile.ZIP_DEFLATED, self.level
+
+    def is_incompressible_type(self, path):
+        """Check the extension and guessed MIME type against known formats"""
+        if os.path.splitext(path)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+            return True
+        mime, encoding = mimetypes.guess_type(path)
+        if encoding:
+            return True
+        if mime and mime not in COMPRESSIBLE_MIME_TYPES:
+            return mime.startswith(INCOMPRESSIBLE_MIME_PREFIXES)
+        return False
+
+    def probe(self, path):
+        """Trial-compress the first block; True if deflate is worth it"""
+        try:
+            with open(path, 'rb') as f:
+                sample = f.read(self.probe_size)
+        except OSError:
+            return True
+        if not sample:
+            return False
+        compressed = zlib.compress(sample, 1)
+        return len(compressed) <= len(sample) * self.probe_ratio
+
+
+class ZipStream:
+    """Generate a ZIP archive as a stream of byte chunks.
+
+    Local headers are written with the data descriptor flag set, so every
+    member can be emitted as soon as it is read; CRCs and sizes follow the
+    data, and the central directory is written last.  ZIP64 records are
+    used whenever a size, offset or entry count overflows the classic format.
+    Memory use is bounded by ``chunk_size`` regardless of the archive size.
+    Each member is stored or deflated as decided by a ``CompressionPolicy``.
+
+    With more than one worker, deflated members are cut into fixed-size
+    blocks that are compressed in a process pool and stitched back in order,
+    so large shares use every core instead of one.  If the pool fails, the
+    rest of the archive is deflated here, block by block; a broken pool is
+    replaced for the next archive.
+    """
+
+    def __init__(self, files, chunk_size=None, policy=None, workers=None):
+        self.members = []
+        for file_path in files:
+            if os.path.isfile(file_path):
+                self.members.append(ZipMember(file_path))
+        self.chunk_size = chunk_size or config.ARCHIVE_CHUNK_SIZE
+        self.block_size = config.ARCHIVE_BLOCK_SIZE
+        self.policy = policy or CompressionPolicy()
+        self.workers = config.ARCHIVE_WORKERS if workers is None else workers
+        self.pool = None
+        self.offset = 0
+        self.bytes_read = 0
+
+    @property
+    def total_size(self):
+        """Combined uncompressed size of all members"""
+        return sum(m.size for m in self.members)
+
+    def __iter__(self):
+        if self.workers > 1:
+            try:
+                self.pool = get_compression_pool(self.workers)
+            except (OSError, ValueError) as e:
+                print(f"Parallel compression unavailable: {e}")
+
+        if self.pool:
+            yield from self._parallel()
+        else:
+            for member in self.members:
+                self._choose(member)
+                yield from self._emit(self._local_header(member))
+                yield from self._member_data(member)
+                yield from self._emit(self._data_descriptor(member))
+        yield from self._emit(self._central_directory())
+
+    def _choose(self, member):
+        if member.method is None:
+            member.method, member.level = self.policy.choose(
+                member.path, member.size)
+
+    def _emit(self, data):
+        self.offset += len(data)
+        yield data
+
+    def _parallel(self):
+        """Emit all members, keeping a window of blocks in the pool"""
+        window = self.workers * 2
+        pending = collections.deque()
+        plan = self._plan()
+        try:
+            for item in plan:
+                pending.append(item)
+                while len(pending) > window:
+                    yield from self._drain(pending.popleft())
+            while pending:
+                yield from self._drain(pending.popleft())
+        finally:
+            plan.close()
+            for item in pending:
+                if isinstance(item[2], Future):
+                    item[2].cancel()
+
+    def _pool_failed(self, error):
+        """Deflate the rest of the archive here"""
+        if self.pool is not None:
+            print(f"Parallel compression failed, continuing serially: {error!r}")
+            discard_compression_pool(self.pool)
+            self.pool = None
+
+    def _deflate(self, block, level, last):
+        """Deflate payload of one block: a pool future, or the fragment"""
+        if self.pool is not None:
+            try:
+                future = self.pool.submit(deflate_block, block, level, last)
+            except POOL_ERRORS as e:
+                self._pool_failed(e)
+            else:
+                # Kept in case the pool fails before the block is done
+                future.block = (block, level, last)
+                return future
+        return deflate_block(block, level, last)
+
+    def _plan(self):
+        """Read members in order and describe the output as work items.
+
+        Items are ``(kind, member, payload)`` tuples; deflate payloads are
+        futures from the pool.  CRCs are computed here, on the raw blocks.
+        """
+        for member in self.members:
+            self._choose(member)
+            yield 'header', member, None
+            crc = 0
+            with open(member.path, 'rb') as f:
+                if member.method == zipfile.ZIP_DEFLATED:
+                    block = f.read(self.block_size)
+                    if not block:
+                        yield 'data', member, deflate_block(b'', member.level, True)
+                    while block:
+                        crc = zlib.crc32(block, crc)
+                        self.bytes_read += len(block)
+                        following = f.read(self.block_size)
+                        if following or len(block) >= self.chunk_size:
+                            payload = self._deflate(block, member.level, not following)
+                        else:
+                            # Not worth the round trip to a worker
+                            payload = deflate_block(block, member.level, True)
+                        yield 'data', member, payload
+                        block = following
+                else:
+                    while True:
+                        chunk = f.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        crc = zlib.crc32(chunk, crc)
+                        self.bytes_read += len(chunk)
+                        yield 'data', member, chunk
+            member.crc = crc
+            yield 'descriptor', member, None
+
+    def _drain(self, item):
+        kind, member, payload = item
+        if kind == 'header':
+            yield from self._emit(self._local_header(member))
+        elif kind == 'data':
+            if isinstance(payload, Future):
+                try:
+                    payload = payload.result()
+                except POOL_ERRORS as e:
+                    self._pool_failed(e)
+                    payload = deflate_block(*payload.block)
+            member.compress_size += len(payload)
+            yield from self._emit(payload)
+        else:
+            yield from self._emit(self._data_descriptor(member))
+
+    def _member_data(self, member):
+        """Read, compress and checksum one member chunk by chunk"""
+        crc = 0
+        compress_size = 0
+        if member.method == zipfile.ZIP_DEFLATED:
+            compressor = zlib.compressobj(
+                member.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        else:
+            compressor = None
+
+        with open(member.path, 'rb') as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                crc = zlib.crc32(chunk, crc)
+                self.bytes_read += len(chunk)
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    compress_size += len(chunk)
+                    yield from self._emit(chunk)
+
+        if compressor:
+            tail = compressor.flush()
+            if tail:
+                compress_size += len(tail)
+                yield from self._emit(tail)
+
+        member.crc = crc
+        member.compress_size = compress_size
+
+    def _local_header(self, member):
+        member.offset = self.offset
+        return local_header(member, descriptor=True)
+
+    def _data_descriptor(self, member):
+        if member.zip64:
+            return struct.pack('<IIQQ', DATA_DESCRIPTOR_SIG, member.crc,
+                               member.compress_size, member.size)
+        return struct.pack('<IIII', DATA_DESCRIPTOR_SIG, member.crc,
+                           member.compress_size, member.size)
+
+    def _central_directory(self):
+        return central_directory(self.members, self.offset, descriptor=True)
+
+
+class ZipLayout:
+    """A store-only ZIP archive whose byte layout is fixed in advance.
+
+    CRCs of all members are computed up front (and cached per file), so
+    every header is known before the first byte is sent.  That gives an
+    exact Content-Length and lets ``open()`` return a seekable reader over
+    the virtual archive: byte ranges are served straight from the member
+    files without ever materializing the ZIP.
+    """
+
+    def __init__(self, files, chunk_size=None):
+        self.members = []
+        for file_path in files:
+            if os.path.isfile(file_path):
+                member = ZipMember(file_path)
+                member.method, member.level = zipfile.ZIP_STORED, 0
+                member.compress_size = member.size
+                self.members.append(member)
+        self.chunk_size = chunk_size or config.ARCHIVE_CHUNK_SIZE
+        self.total_size = sum(m.size for m in self.members)
+        self.mtime = max((m.mtime for m in self.members), default=time.time())
+
+        self.bytes_read = 0
+        self.ready = False
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.thread = None
+        self.thread_lock = threading.Lock()
+
+        # Sizes and offsets do not depend on the CRCs, so the length is
+        # known now; headers are rebuilt with real CRCs in prepare()
+        self._layout()
+
+    @property
+    def progress(self):
+        """Fraction of the member data checksummed so far (0.0 - 1.0)"""
+        if self.ready or not self.total_size:
+            return 1.0 if self.ready else 0.0
+        return min(self.bytes_read / self.total_size, 1.0)
+
+    @property
+    def done(self):
+        return self.ready
+
+    @property
+    def ok(self):
+        return self.ready
+
+    def cancel(self):
+        self.cancelled = True
+
+    def prepare(self):
+        """Checksum every member and lay out the archive; True when ready"""
+        with self.lock:
+            if self.ready:
+                return True
+            self.cancelled = False
+            self.bytes_read = 0
+            for member in self.members:
+                if not self._checksum(member):
+                    return False
+            self._layout()
+            self.ready = True
+            return True
+
+    def prepare_in_background(self):
+        """Start prepare() in a thread unless ready or already under way"""
+        with self.thread_lock:
+            if not self.ready and not (self.thread and self.thread.is_alive()):
+                self.thread = threading.Thread(target=self.prepare, daemon=True)
+                self.thread.start()
+
+    def _checksum(self, member):
+        key = member.identity
+        with _crc_lock:
+            crc = _crc_cache.get(key)
+            if crc is not None:
+                _crc_cache.move_to_end(key)
+        if crc is None:
+            crc = 0
+            with open(member.path, 'rb') as f:
+                while True:
+                    if self.cancelled:
+                        return False
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    crc = zlib.crc32(chunk, crc)
+                    self.bytes_read += len(chunk)
+            with _crc_lock:
+                _crc_cache[key] = crc
+                while len(_crc_cache) > config.ZIP_CRC_CACHE_SIZE:
+                    _crc_cache.popitem(last=False)
+        else:
+            self.bytes_read += member.size
+        member.crc = crc
+        return True
+
+    def _layout(self):
+        offset = 0
+        segments = []
+        for member in self.members:
+            member.offset = offset
+            header = local_header(member, descriptor=False)
+            segments.append((offset, len(header), header, None))
+            offset += len(header)
+            if member.size:
+                segments.append((offset, member.size, None, member))
+                offset += member.size
+        trailer = central_directory(self.members, offset, descriptor=False)
+        segments.append((offset, len(trailer), trailer, None))
+        self.size = offset + len(trailer)
+        self.segments = segments
+        self.offsets = [segment[0] for segment in segments]
+
+    def open(self):
+        """Return a seekable binary file object over the archive bytes"""
+        if not self.prepare():
+            raise RuntimeError("Archive layout was cancelled")
+        return io.BufferedReader(ZipLayoutReader(self), self.chunk_size)
+
+
+class ZipLayoutReader(io.RawIOBase):
+    """Raw reader that maps archive offsets onto headers and member files"""
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.position = 0
+        self.file = None
+        self.file_member = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.layout.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self.position = offset
+        return offset
+
+    def readinto(self, buffer):
+        layout = self.layout
+        if self.position >= layout.size:
+            return 0
+        index = bisect.bisect_right(layout.offsets, self.position) - 1
+        start, length, data, member = layout.segments[index]
+        within = self.position - start
+        count = min(len(buffer), length - within)
+
+        if data is not None:
+            buffer[:count] = data[within:within + count]
+        else:
+            f = self._member_file(member)
+            f.seek(within)
+            count = f.readinto(memoryview(buffer)[:count])
+            if not count:
+                raise IOError(f"{member.path} changed while being served")
+        self.position += count
+        return count
+
+    def _member_file(self, member):
+        if self.file_member is not member:
+            self._close_file()
+            f = open(member.path, 'rb')
+            st = os.fstat(f.fileno())
+            if st.st_size != member.size or st.st_mtime_ns != member.mtime_ns:
+                f.close()
+                raise IOError(f"{member.path} changed while being served")
+            self.file, self.file_member = f, member
+        return self.file
+
+    def _close_file(self):
+        if self.file:
+            self.file.close()
+            self.file = self.file_member = None
+
+    def close(self):
+        self._close_file()
+        super().close()
+
+
+def local_header(member, descriptor):
+    """Build the local file header for ``member``.
+
+    With ``descriptor`` set, CRC and sizes are left for the data descriptor
+    that follows the member data; otherwise they must already be known.
+    """
+    name, flags = member.encoded_name
+    dos_time, dos_date = dos_datetime(member.mtime)
+
+    if descriptor:
+        flags |= FLAG_DATA_DESCRIPTOR
+        crc, compress_size, size = 0, 0, 0
+    else:
+        crc, compress_size, size = member.crc, member.compress_size, member.size
+
+    if member.zip64:
+        version = zipfile.ZIP64_VERSION
+        extra = struct.pack('<HHQQ', ZIP64_EXTRA_ID, 16, size, compress_size)
+        compress_size = size = ZIP32_MAX
+    else:
+        version = zipfile.DEFAULT_VERSION
+        extra = b''
+
+    header = struct.pack(
+        '<IHHHHHIIIHH',
+        LOCAL_HEADER_SIG, version, flags, member.method, dos_time, dos_date,
+        crc, compress_size, size, len(name), len(extra)
+    )
+    return header + name + extra
+
+
+def central_header(member, descriptor):
+    """Build the central directory record for ``member``"""
+    name, flags = member.encoded_name
+    dos_time, dos_date = dos_datetime(member.mtime)
+    if descriptor:
+        flags |= FLAG_DATA_DESCRIPTOR
+
+    zip64_fields = []
+    size = member.size
+    compress_size = member.compress_size
+    offset = member.offset
+    if size > zipfile.ZIP64_LIMIT:
+        zip64_fields.append(size)
+        size = ZIP32_MAX
+    if compress_size > zipfile.ZIP64_LIMIT:
+        zip64_fields.append(compress_size)
+        compress_size = ZIP32_MAX
+    if offset > zipfile.ZIP64_LIMIT:
+        zip64_fields.append(offset)
+        offset = ZIP32_MAX
+
+    extra = b''
+    version = zipfile.DEFAULT_VERSION
+    if zip64_fields or member.zip64:
+        version = zipfile.ZIP64_VERSION
+    if zip64_fields:
+        extra = struct.pack(
+            '<HH' + 'Q' * len(zip64_fields),
+            ZIP64_EXTRA_ID, 8 * len(zip64_fields), *zip64_fields
+        )
+
+    header = struct.pack(
+        '<IBBHHHHHIIIHHHHHII',
+        CENTRAL_HEADER_SIG, version, 3, version,
+        flags, member.method, dos_time, dos_date,
+        member.crc, compress_size, size,
+        len(name), len(extra), 0, 0, 0, 0o100644 << 16, offset
+    )
+    return header + name + extra
+
+
+def central_directory(members, cd_offset, descriptor):
+    """Build the central directory and end records for ``members``"""
+    records = [central_header(m, descriptor) for m in members]
+    cd_size = sum(len(r) for r in records)
+    count = len(members)
+
+    if (count > ZIP16_MAX or cd_size > zipfile.ZIP64_LIMIT
+            or cd_offset > zipfile.ZIP64_LIMIT):
+        zip64_end_offset = cd_offset + cd_size
+        records.append(struct.pack(
+            '<IQHHIIQQQQ',
+            ZIP64_END_SIG, 44, zipfile.ZIP64_VERSION,
+            zipfile.ZIP64_VERSION, 0, 0,
+            count, count, cd_size, cd_offset
+        ))
+        records.append(struct.pack(
+            '<IIQI', ZIP64_LOCATOR_SIG, 0, zip64_end_offset, 1))
+        count = min(count, ZIP16_MAX)
+        cd_size = min(cd_size, ZIP32_MAX)
+        cd_offset = min(cd_offset, ZIP32_MAX)
+
+    records.append(struct.pack(
+        '<IHHHHIIH', END_SIG, 0, 0, count, count, cd_size, cd_offset, 0))
+    return b''.join(records)
+
+
+class BackgroundIterator:
+    """Run an iterator in a worker thread, buffering through a bounded queue.
+
+    Chaining these lets disk reads, compression and socket writes proceed
+    at the same time.  Closing the iterator stops the worker.
+    """
+
+    _DONE = object()
+
+    def __init__(self, source, depth=None):
+        self.source = source
+        self.queue = queue.Queue(maxsize=depth or config.ARCHIVE_PIPELINE_DEPTH)
+        self.stopped = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            for item in self.source:
+                if not self._put(item):
+                    return
+        except Exception as e:
+            self.error = e
+        finally:
+            close = getattr(self.source, 'close', None)
+            if close:
+                close()
+            self._put(self._DONE)
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self.queue.get()
+                if item is self._DONE:
+                    break
+                yield item
+            if self.error:
+                raise self.error
+        finally:
+            self.close()
+
+    def close(self):
+        self.stopped.set()
+
+
+class TarStream:
+    """Generate a tar (optionally gzip or zstd compressed) archive stream.
+
+    Members are written as PAX headers followed by the file data, so long
+    or non-ASCII names and files over 8 GB need no special casing.  Reading
+    and compression each run in their own background thread.
+    """
+
+    def __init__(self, files, compression=None, chunk_size=None):
+        self.files = [f for f in files if os.path.isfile(f)]
+        self.compression = compression
+        self.chunk_size = chunk_size or config.ARCHIVE_CHUNK_SIZE
+
+    def __iter__(self):
+        chunks = BackgroundIterator(self._tar_chunks())
+        if self.compression == 'gzip':
+            chunks = BackgroundIterator(self._gzip(chunks))
+        elif self.compression == 'zstd':
+            chunks = BackgroundIterator(self._zstd(chunks))
+        return iter(chunks)
+
+    def _tar_chunks(self):
+        written = 0
+        for file_path in self.files:
+            with open(file_path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                info = tarfile.TarInfo(os.path.basename(file_path))
+                info.size = st.st_size
+                info.mtime = st.st_mtime
+                info.mode = 0o644
+                header = info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+                yield header
+                written += len(header)
+
+                remaining = info.size
+                while remaining > 0:
+                    data = f.read(min(self.chunk_size, remaining))
+                    if not data:
+                        # File shrank after the header went out: pad it
+                        data = bytes(min(self.chunk_size, remaining))
+                    remaining -= len(data)
+                    written += len(data)
+                    yield data
+
+            padding = -info.size % tarfile.BLOCKSIZE
+            if padding:
+                yield bytes(padding)
+                written += padding
+
+        # End-of-archive marker, padded to a whole record like tarfile does
+        trailer = 2 * tarfile.BLOCKSIZE
+        trailer += -(written + trailer) % tarfile.RECORDSIZE
+        yield bytes(trailer)
+
+    def _gzip(self, chunks):
+        compressor = zlib.compressobj(
+            config.TAR_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def _zstd(self, chunks):
+        compressor = zstandard.ZstdCompressor(
+            level=config.TAR_ZSTD_LEVEL).compressobj()
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
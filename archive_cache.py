@@ -0,0 +1,375 @@
+"""
+On-disk cache of finished share archives for SecureShare Pro
+"""
+
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import weakref
+from pathlib import Path
+
+import zipfile
+
+import config
+from archive import CompressionPolicy, ZipLayout, ZipStream
+
+try:
+    import fcntl
+    FLOCK_OK = True
+except ImportError:
+    FLOCK_OK = False
+
+# Caches to reset in forked children: builds and their locks belong to the
+# process that started them
+_caches = weakref.WeakSet()
+
+
+def _after_fork():
+    for cache in list(_caches):
+        cache.after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class ArchiveBuild:
+    """One archive being written to (or already sitting in) the cache.
+
+    Any number of readers can stream the archive while it is still being
+    built: they follow the file as it grows and wait for the builder when
+    they catch up.  The archive is written to a temporary file of its own
+    and moved into place only once complete, so a failed or cancelled
+    build never touches the file of another build for the same share.
+    Readers in other processes cannot follow it; ``claim`` makes sure only
+    one process builds a given archive at a time.
+    """
+
+    def __init__(self, key, path, files=None):
+        self.key = key
+        self.path = Path(path)
+        self.meta_path = self.path.with_suffix('.json')
+        self.lock_path = self.path.with_suffix('.lock')
+        self.lock_file = None
+        self.tmp_path = None
+        self.files = files
+        self.stream = None
+        self.written = 0
+        self.done = False
+        self.cancelled = False
+        self.error = None
+        self.cond = threading.Condition()
+
+    @classmethod
+    def finished(cls, key, path):
+        build = cls(key, path)
+        build.written = build.path.stat().st_size
+        build.done = True
+        return build
+
+    @property
+    def progress(self):
+        """Fraction of the source data consumed so far (0.0 - 1.0)"""
+        if self.done:
+            return 1.0
+        if not self.stream or not self.stream.total_size:
+            return 0.0
+        return min(self.stream.bytes_read / self.stream.total_size, 1.0)
+
+    @property
+    def ok(self):
+        return self.done and self.error is None
+
+    def claim(self):
+        """Take the build lock shared by every process using the cache
+        directory; False when another process is building this archive"""
+        if not FLOCK_OK:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self.lock_file = lock_file
+        return True
+
+    def release(self):
+        if self.lock_file is not None:
+            # Unlock explicitly: a worker forked during the build shares
+            # the descriptor, so closing ours alone would keep the lock
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+
+    def start(self):
+        """Create the output file and start building in the background"""
+        self.stream = ZipStream(self.files)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.path.parent, prefix=f"{self.path.stem}.", suffix='.part')
+        self.tmp_path = Path(tmp_path)
+        out = os.fdopen(fd, 'wb')
+        threading.Thread(target=self._run, args=(out,), daemon=True).start()
+
+    def cancel(self):
+        with self.cond:
+            if not self.done:
+                self.cancelled = True
+
+    def _run(self, out):
+        try:
+            with out:
+                for chunk in self.stream:
+                    if self.cancelled:
+                        raise RuntimeError("Archive build cancelled")
+                    out.write(chunk)
+                    out.flush()
+                    with self.cond:
+                        self.written += len(chunk)
+                        self.cond.notify_all()
+            os.replace(self.tmp_path, self.path)
+            # The metadata file marks the archive as complete
+            tmp = self.meta_path.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                json.dump({'size': self.written, 'files': self.files}, f)
+            os.replace(tmp, self.meta_path)
+        except Exception as e:
+            print(f"Archive build failed: {e}")
+            with self.cond:
+                self.error = e
+            try:
+                self.tmp_path.unlink()
+            except OSError:
+                pass
+        finally:
+            self.release()
+            with self.cond:
+                self.done = True
+                self.cond.notify_all()
+
+    def open(self):
+        """Open the archive, or the file it is being built in"""
+        with self.cond:
+            building = not self.done and self.tmp_path is not None
+        if not building:
+            return open(self.path, 'rb')
+        try:
+            return open(self.tmp_path, 'rb')
+        except FileNotFoundError:
+            # Finished and moved into place in the meantime
+            return open(self.path, 'rb')
+
+    def iter_chunks(self, chunk_size=None):
+        """Stream the archive, following the file while it is being built"""
+        chunk_size = chunk_size or config.ARCHIVE_CHUNK_SIZE
+        with self.open() as f:
+            position = 0
+            while True:
+                data = f.read(chunk_size)
+                if data:
+                    position += len(data)
+                    yield data
+                    continue
+                with self.cond:
+                    self.cond.wait_for(
+                        lambda: self.done or self.written > position,
+                        timeout=1.0
+                    )
+                    if self.error:
+                        raise self.error
+                    if self.done and position >= self.written:
+                        return
+
+
+class ArchiveCache:
+    """Size-bounded LRU cache of built archives keyed by share manifest.
+
+    Requests for an archive that is already being built attach to that
+    build instead of starting another one (single-flight).  Processes
+    (pre-forked workers) share only what is on disk, the completion marker
+    and a lock file per archive: one of them builds it and the others
+    stream the archive live meanwhile.  Shares that would not benefit from
+    deflate get a store-only ``ZipLayout`` instead, which needs no disk
+    space and supports byte ranges directly.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = Path(cache_dir or config.ARCHIVE_CACHE_DIR)
+        self.max_bytes = max_bytes or config.ARCHIVE_CACHE_MAX_BYTES
+        self.builds = {}
+        # Layouts of whole shares and selected subsets, LRU
+        self.layouts = collections.OrderedDict()
+        self.lock = threading.Lock()
+        _caches.add(self)
+
+    def after_fork(self):
+        # Builds running in the parent have no thread here to finish them
+        self.builds = {}
+        self.layouts = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def manifest_key(files, fmt='zip'):
+        """Hash the paths, sizes and mtimes of the files plus ZIP settings"""
+        entries = []
+        for file_path in files:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            entries.append([os.path.abspath(file_path),
+                            st.st_size, st.st_mtime_ns])
+        manifest = {
+            'format': fmt,
+            'level': config.ZIP_COMPRESSION_LEVEL,
+            'files': entries,
+        }
+        encoded = json.dumps(manifest, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, files):
+        """Return the finished or in-progress build for ``files``, or None
+        while another process is building it"""
+        key = self.manifest_key(files)
+        with self.lock:
+            build = self.builds.get(key)
+            if build and not build.error and not build.cancelled:
+                if build.done:
+                    self._touch(build)
+                return build
+
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self.cache_dir / f"{key}.zip"
+            if self._is_complete(path):
+                build = ArchiveBuild.finished(key, path)
+                self._touch(build)
+            else:
+                build = ArchiveBuild(key, path, [str(f) for f in files])
+                if not build.claim():
+                    return None
+                if self._is_complete(path):
+                    # Finished by another process since the first check
+                    build.release()
+                    build = ArchiveBuild.finished(key, path)
+                    self._touch(build)
+                else:
+                    try:
+                        build.start()
+                    except OSError:
+                        build.release()
+                        raise
+                    threading.Thread(
+                        target=self._evict_after, args=(build,), daemon=True).start()
+            self.builds[key] = build
+            return build
+
+    def find(self, files):
+        """Return the finished or in-progress build for ``files`` without
+        starting one; None if there is neither"""
+        key = self.manifest_key(files)
+        with self.lock:
+            build = self.builds.get(key)
+            if build and not build.error and not build.cancelled:
+                return build
+        path = self.cache_dir / f"{key}.zip"
+        if self._is_complete(path):
+            return ArchiveBuild.finished(key, path)
+        return None
+
+    def get_layout(self, files):
+        """Return the Range-capable store-only layout for ``files``.
+
+        Returns None when the share should be deflated instead, as decided
+        by ``config.ZIP_RESUMABLE_MODE``.  The layout is not prepared yet.
+        Layouts are kept by manifest key, so a subset picked again reuses
+        its checksums.
+        """
+        mode = config.ZIP_RESUMABLE_MODE
+        if mode == 'never':
+            return None
+        key = self.manifest_key(files, 'zip-stored')
+        with self.lock:
+            if key in self.layouts:
+                self.layouts.move_to_end(key)
+                return self.layouts[key]
+
+        layout = ZipLayout(files)
+        if mode == 'auto':
+            policy = CompressionPolicy()
+            for member in layout.members:
+                method, level = policy.choose(member.path, member.size)
+                if method != zipfile.ZIP_STORED:
+                    layout = None
+                    break
+
+        with self.lock:
+            layout = self.layouts.setdefault(key, layout)
+            while len(self.layouts) > config.ARCHIVE_LAYOUT_CACHE_SIZE:
+                self.layouts.popitem(last=False)
+            return layout
+
+    def prebuild(self, files):
+        """Start preparing the archive for ``files`` ahead of any request;
+        None if another process is already building it"""
+        layout = self.get_layout(files)
+        if layout:
+            layout.prepare_in_background()
+            return layout
+        return self.get(files)
+
+    def _is_complete(self, path):
+        meta_path = path.with_suffix('.json')
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            return path.stat().st_size == meta['size']
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def _touch(self, build):
+        try:
+            os.utime(build.meta_path)
+        except OSError:
+            pass
+
+    def _evict_after(self, build):
+        with build.cond:
+            build.cond.wait_for(lambda: build.done)
+        self.evict(keep=build.key)
+
+    def evict(self, keep=None):
+        """Delete least recently used archives until under ``max_bytes``"""
+        with self.lock:
+            busy = {k for k, b in self.builds.items() if not b.done}
+            if keep:
+                busy.add(keep)
+
+            entries = []
+            total = 0
+            for meta_path in self.cache_dir.glob('*.json'):
+                path = meta_path.with_suffix('.zip')
+                try:
+                    size = path.stat().st_size
+                    used = meta_path.stat().st_mtime
+                except OSError:
+                    continue
+                total += size
+                if meta_path.stem not in busy:
+                    entries.append((used, meta_path, path, size))
+
+            entries.sort()
+            for used, meta_path, path, size in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    # Drop the marker first so a half-deleted entry is stale
+                    meta_path.unlink()
+                    path.unlink()
+                except OSError:
+                    # Still open by a reader (Windows); try again next time
+                    continue
+                total -= size
+                self.builds.pop(meta_path.stem, None)
@@ -0,0 +1,558 @@
+"""
+asyncio serving engine for SecureShare Pro's FileServer
+"""
+
+import asyncio
+import html
+import http.client
+import io
+import mimetypes
+import os
+import posixpath
+import socket
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import config
+import http_utils
+import pagecache
+from blockcache import BlockCache, CachedFile
+from encoded_cache import EncodedCache, available_encodings
+from listing import ListingCache, ListingPage
+from reaper import Reaper, SendFloor
+from transport import TransportTuner
+
+# Read size when copying response bodies
+COPY_CHUNK_SIZE = 64 * 1024
+# Longest request line plus headers accepted from a client
+MAX_HEADER_BYTES = 64 * 1024
+SERVER_NAME = "SecureShare"
+
+
+class Request:
+    """Request line and headers of one HTTP request"""
+
+    def __init__(self, method, path, version, headers):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('Connection', '').lower()
+        if self.version == 'HTTP/1.1':
+            return 'close' not in connection
+        return 'keep-alive' in connection
+
+
+def translate_path(directory, path):
+    """Map a URL path onto ``directory``, ignoring '..' and drive components"""
+    path = path.split('?', 1)[0].split('#', 1)[0]
+    trailing_slash = path.rstrip().endswith('/')
+    try:
+        path = urllib.parse.unquote(path, errors='surrogatepass')
+    except UnicodeDecodeError:
+        path = urllib.parse.unquote(path)
+    result = directory
+    for word in filter(None, posixpath.normpath(path).split('/')):
+        if os.path.dirname(word) or word in (os.curdir, os.pardir):
+            continue
+        result = os.path.join(result, word)
+    if trailing_slash:
+        result += '/'
+    return result
+
+
+class AsyncHTTPServer:
+    """Serve a directory from an asyncio event loop.
+
+    Connections are handled as coroutines on non-blocking sockets, so idle
+    and slow clients cost a few kilobytes each instead of a thread.  Disk
+    access (stat, open, read) runs on a small thread pool so a slow disk
+    never stalls the loop.  Exposes the ``serve_forever`` / ``shutdown`` /
+    ``server_close`` interface of ``socketserver`` so FileServer can drive
+    either engine the same way.
+    """
+
+    def __init__(self, server_address, directory, password=None,
+                 activity_callback=None, tracker=None, encoded_cache=None,
+                 listing_cache=None, block_cache=None, transport=None,
+                 reaper=None, disk_threads=None, backlog=None, sock=None):
+        self.directory = os.fspath(directory)
+        self.password = password
+        self.activity_callback = activity_callback
+        self.tracker = tracker
+        self.encoded_cache = encoded_cache or EncodedCache()
+        self.listing_cache = listing_cache or ListingCache()
+        self.block_cache = block_cache or BlockCache()
+        self.transport = transport or TransportTuner()
+        self.reaper = reaper or Reaper()
+        # Bind now, like TCPServer, so a busy port fails in FileServer.start
+        # (unless handed a listening socket)
+        self.socket = sock or socket.create_server(
+            server_address, backlog=backlog or config.SERVER_BACKLOG)
+        self.server_address = self.socket.getsockname()
+        self.disk = ThreadPoolExecutor(
+            max_workers=disk_threads or config.ASYNC_DISK_THREADS,
+            thread_name_prefix='AsyncDisk')
+        self.connections = {}
+        # Minimum-rate tracking of the response in progress, per connection
+        self.floors = {}
+        self.loop = None
+        self.stopping = None
+        self.started = threading.Event()
+        self.finished = threading.Event()
+
+    def serve_forever(self):
+        """Run the event loop until ``shutdown`` is called"""
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self.finished.set()
+
+    def shutdown(self):
+        """Stop ``serve_forever`` and wait for it to return"""
+        if not self.started.wait(timeout=5):
+            return
+        self.loop.call_soon_threadsafe(self.stopping.set)
+        self.finished.wait()
+
+    def server_close(self):
+        self.socket.close()
+        self.disk.shutdown(wait=False)
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        server = await asyncio.start_server(
+            self.handle_connection, sock=self.socket, limit=MAX_HEADER_BYTES)
+        self.started.set()
+        async with server:
+            await self.stopping.wait()
+            server.close()
+            # Closing the transports ends each handler at its next read/write
+            for writer in list(self.connections):
+                writer.close()
+            tasks = list(self.connections.values())
+            if tasks:
+                await asyncio.wait(tasks, timeout=5)
+
+    async def run_disk(self, func, *args):
+        """Run a blocking filesystem call on the disk pool"""
+        return await self.loop.run_in_executor(self.disk, func, *args)
+
+    async def handle_connection(self, reader, writer):
+        self.connections[writer] = asyncio.current_task()
+        sock = writer.get_extra_info('socket')
+        try:
+            self.transport.tune(sock)
+            for count in range(1, config.KEEPALIVE_MAX_REQUESTS + 1):
+                self.floors[writer] = SendFloor()
+                try:
+                    request = await self.read_request(reader, writer)
+                except (ValueError, http.client.HTTPException):
+                    await self.send_error(writer, None, HTTPStatus.BAD_REQUEST, False)
+                    break
+                if request is None:
+                    break
+                self.transport.cork(sock)
+                try:
+                    keep_alive = await self.respond(
+                        request, writer, last=count == config.KEEPALIVE_MAX_REQUESTS)
+                finally:
+                    self.transport.cork(sock, False)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.TimeoutError, asyncio.LimitOverrunError):
+            pass
+        except Exception as e:
+            print(f"Error in async handler: {e}")
+        finally:
+            self.connections.pop(writer, None)
+            self.floors.pop(writer, None)
+            writer.close()
+
+    async def read_request(self, reader, writer):
+        """Read one request head; None when the client closed the connection.
+
+        The wait for a request is bounded by the keep-alive timeout; once it
+        starts arriving the whole head must follow within HEADER_TIMEOUT.
+        """
+        # Timers are cheaper than wait_for, which wraps every read in a task
+        timer = self.loop.call_later(config.KEEPALIVE_TIMEOUT, self.expire, writer, 'idle')
+        try:
+            head = await reader.read(1)
+        finally:
+            timer.cancel()
+        if not head:
+            return None
+        timer = self.loop.call_later(config.HEADER_TIMEOUT, self.expire, writer, 'header')
+        try:
+            head += await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError:
+            return None
+        finally:
+            timer.cancel()
+        request_line, _, rest = head.partition(b'\r\n')
+        words = request_line.decode('iso-8859-1').split()
+        if len(words) != 3 or not words[2].startswith('HTTP/'):
+            raise ValueError(f"Bad request line: {request_line!r}")
+        headers = http.client.parse_headers(io.BytesIO(rest))
+        return Request(words[0], words[1], words[2], headers)
+
+    def start_response(self, writer, status, headers, keep_alive):
+        lines = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            f"Server: {SERVER_NAME}",
+            f"Date: {http_utils.http_date(time.time())}",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1', 'strict'))
+
+    async def send_simple(self, writer, request, status, headers, body, keep_alive):
+        """Send a small in-memory response"""
+        headers = headers + [("Content-Length", str(len(body)))]
+        self.start_response(writer, status, headers, keep_alive)
+        if request is None or request.method != 'HEAD':
+            writer.write(body)
+        await self.drain(writer)
+        return keep_alive
+
+    async def send_error(self, writer, request, status, keep_alive, message=None):
+        body = (f"<html><head><title>Error response</title></head><body>"
+                f"<h1>Error response</h1><p>Error code: {status.value}</p>"
+                f"<p>Message: {html.escape(message or status.phrase)}.</p>"
+                f"</body></html>\n").encode('utf-8')
+        headers = [("Content-Type", "text/html;charset=utf-8")]
+        return await self.send_simple(writer, request, status, headers, body, keep_alive)
+
+    async def respond(self, request, writer, last=False):
+        """Answer one request; returns whether the connection stays open.
+
+        ``last`` marks the final request allowed on this connection, whose
+        response announces the close.
+        """
+        keep_alive = request.keep_alive and not last
+        if request.headers.get('Content-Length', '0').strip() not in ('', '0'):
+            # Request bodies are never read, so the stream cannot be reused
+            keep_alive = False
+        if request.method not in ('GET', 'HEAD'):
+            return await self.send_error(writer, request, HTTPStatus.NOT_IMPLEMENTED,
+                                         False, f"Unsupported method ({request.method!r})")
+
+        if self.password:
+            auth = request.headers.get('Authorization')
+            if not auth or not http_utils.check_basic_auth(auth, self.password):
+                headers = [("WWW-Authenticate", 'Basic realm="SecureShare"'),
+                           ("Content-type", "text/html")]
+                return await self.send_simple(writer, request, HTTPStatus.UNAUTHORIZED,
+                                              headers, b'Authentication required',
+                                              keep_alive)
+
+        if request.method == 'GET' and self.activity_callback:
+            self.activity_callback('GET', request.path)
+
+        path = translate_path(self.directory, request.path)
+        if await self.run_disk(os.path.isdir, path):
+            return await self.send_directory(request, writer, path, keep_alive)
+        if path.endswith('/'):
+            return await self.send_error(writer, request, HTTPStatus.NOT_FOUND,
+                                         keep_alive, "File not found")
+        return await self.send_file(request, writer, path, keep_alive)
+
+    async def send_directory(self, request, writer, path, keep_alive):
+        parts = urllib.parse.urlsplit(request.path)
+        if not parts.path.endswith('/'):
+            location = urllib.parse.urlunsplit(
+                (parts[0], parts[1], parts[2] + '/', parts[3], parts[4]))
+            return await self.send_simple(writer, request, HTTPStatus.MOVED_PERMANENTLY,
+                                          [("Location", location)], b'', keep_alive)
+
+        for index in ("index.html", "index.htm"):
+            index_path = os.path.join(path, index)
+            if await self.run_disk(os.path.isfile, index_path):
+                return await self.send_file(request, writer, index_path, keep_alive)
+
+        try:
+            # Scanning and sorting a big directory must not stall the loop
+            page = await self.run_disk(self.listing_page, path, parts)
+        except OSError:
+            return await self.send_error(writer, request, HTTPStatus.NOT_FOUND,
+                                         keep_alive, "No permission to list directory")
+        chunked = request.version == 'HTTP/1.1'
+        keep_alive = keep_alive and chunked
+        headers = [("Content-type", page.content_type), ("Cache-Control", "no-cache")]
+        if chunked:
+            headers.append(("Transfer-Encoding", "chunked"))
+        self.start_response(writer, HTTPStatus.OK, headers, keep_alive)
+        if request.method != 'HEAD':
+            for data in page:
+                writer.write(frame(data, chunked))
+                await self.drain(writer)
+            if chunked:
+                writer.write(b'0\r\n\r\n')
+        await self.drain(writer)
+        return keep_alive
+
+    def listing_page(self, path, url):
+        return ListingPage(self.listing_cache.get(path), url.path, url.query)
+
+    def validators(self, st, etag, compressible):
+        headers = [
+            ("ETag", etag),
+            ("Last-Modified", http_utils.http_date(st.st_mtime)),
+            ("Cache-Control", http_utils.cache_control(private=bool(self.password))),
+        ]
+        if compressible:
+            headers.append(("Vary", "Accept-Encoding"))
+        return headers
+
+    async def send_file(self, request, writer, path, keep_alive):
+        """Send a file with validators, content-coding and byte ranges,
+        following the same rules as CustomHTTPRequestHandler.send_head"""
+        try:
+            st = await self.run_disk(os.stat, path)
+        except OSError:
+            return await self.send_error(writer, request, HTTPStatus.NOT_FOUND,
+                                         keep_alive, "File not found")
+
+        ctype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        compressible = await self.run_disk(self.encoded_cache.should_encode, path, st)
+        encoding = None
+        if compressible:
+            encoding = http_utils.negotiate_encoding(
+                request.headers.get('Accept-Encoding'), available_encodings())
+
+        body_path, body_st = path, st
+        if encoding:
+            sidecar = await self.run_disk(self.encoded_cache.lookup, path, st, encoding)
+            if sidecar:
+                body_path = sidecar
+                body_st = await self.run_disk(os.stat, sidecar)
+            elif 'Range' in request.headers:
+                encoding = None
+        length = body_st.st_size
+        etag = http_utils.file_etag(st, encoding)
+        validators = self.validators(st, etag, compressible)
+
+        if http_utils.not_modified(request.headers.get('If-None-Match'),
+                                   request.headers.get('If-Modified-Since'),
+                                   etag, st.st_mtime):
+            self.start_response(writer, HTTPStatus.NOT_MODIFIED, validators, keep_alive)
+            await self.drain(writer)
+            return keep_alive
+
+        if encoding and body_path == path:
+            return await self.send_encoded(request, writer, path, st, encoding,
+                                           [("Content-type", ctype)] + validators,
+                                           keep_alive)
+
+        ranges = None
+        if http_utils.if_range_matches(request.headers.get('If-Range'), etag, st.st_mtime):
+            try:
+                ranges = http_utils.parse_range_header(
+                    request.headers.get('Range'), length)
+            except http_utils.RangeNotSatisfiable:
+                headers = [("Content-Range", f"bytes */{length}")]
+                return await self.send_simple(
+                    writer, request, HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                    headers, b'', keep_alive)
+
+        f = None
+        if request.method != 'HEAD':
+            try:
+                if self.block_cache.cacheable(body_st):
+                    # Hot files are then sent without leaving the loop
+                    f = CachedFile(self.block_cache, body_path, body_st)
+                else:
+                    f = await self.run_disk(open, body_path, 'rb')
+            except OSError:
+                return await self.send_error(writer, request, HTTPStatus.NOT_FOUND,
+                                             keep_alive, "File not found")
+
+        multipart = None
+        if ranges is None:
+            status = HTTPStatus.OK
+            headers = [("Content-type", ctype), ("Content-Length", str(length))]
+        elif len(ranges) == 1:
+            start, stop = ranges[0]
+            status = HTTPStatus.PARTIAL_CONTENT
+            headers = [("Content-type", ctype),
+                       ("Content-Range", http_utils.content_range(start, stop, length)),
+                       ("Content-Length", str(stop - start))]
+        else:
+            multipart = http_utils.MultipartRanges(ranges, length, ctype)
+            status = HTTPStatus.PARTIAL_CONTENT
+            headers = [("Content-type", multipart.content_type),
+                       ("Content-Length", str(multipart.content_length))]
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+        headers.append(("Accept-Ranges", "bytes"))
+        self.start_response(writer, status, headers + validators, keep_alive)
+
+        if f is None:
+            await self.drain(writer)
+            return keep_alive
+        if multipart:
+            hint = pagecache.SendHint(f, min(start for _, start, _ in multipart),
+                                      max(stop for _, _, stop in multipart))
+        elif ranges:
+            hint = pagecache.SendHint(f, *ranges[0])
+        else:
+            hint = pagecache.SendHint(f, 0, length)
+        complete = False
+        try:
+            if multipart:
+                for header, start, stop in multipart:
+                    writer.write(header)
+                    await self.copy_range(writer, f, start, stop)
+                writer.write(multipart.trailer)
+            elif ranges:
+                await self.copy_range(writer, f, *ranges[0])
+            else:
+                await self.copy_range(writer, f, 0, length)
+            await self.drain(writer)
+            complete = True
+        finally:
+            hint.done(complete)
+            f.close()
+        return keep_alive
+
+    async def send_encoded(self, request, writer, path, st, encoding, headers, keep_alive):
+        """Stream a file compressed on the fly, chunked for HTTP/1.1 clients"""
+        chunked = request.version == 'HTTP/1.1'
+        keep_alive = keep_alive and chunked
+        headers = headers + [("Content-Encoding", encoding)]
+        if chunked:
+            headers.append(("Transfer-Encoding", "chunked"))
+        self.start_response(writer, HTTPStatus.OK, headers, keep_alive)
+        if request.method == 'HEAD':
+            await self.drain(writer)
+            return keep_alive
+
+        stream = self.encoded_cache.stream(path, st, encoding)
+        try:
+            while True:
+                data = await self.run_disk(next, stream, None)
+                if data is None:
+                    break
+                if not data:
+                    continue
+                writer.write(frame(data, chunked))
+                await self.drain(writer)
+                self.track(len(data))
+            if chunked:
+                writer.write(b'0\r\n\r\n')
+            await self.drain(writer)
+        finally:
+            await self.run_disk(stream.close)
+        return keep_alive
+
+    async def copy_range(self, writer, f, start, stop):
+        """Copy ``[start, stop)`` of ``f`` to the client.
+
+        Uses the loop's sendfile, which is zero-copy on plain sockets and
+        falls back to buffered sends for TLS transports.  Without it, reads
+        run on the disk pool.  Cached blocks are written straight from
+        memory; only missing ones are loaded on the disk pool.
+        """
+        if isinstance(f, CachedFile):
+            cache = self.block_cache
+            for index, lo, hi in cache.spans(start, stop):
+                data = cache.get(f.st, index)
+                if data is None:
+                    data = await self.run_disk(cache.load, f.path, f.st, index)
+                data = memoryview(data)[lo:hi]
+                while data:
+                    chunk = data[:self.floors[writer].chunk_size(len(data))]
+                    writer.write(chunk)
+                    await self.drain(writer)
+                    self.track(len(chunk))
+                    data = data[len(chunk):]
+            return
+
+        if config.USE_SENDFILE:
+            await self.drain(writer)
+            position = start
+            while position < stop:
+                count = min(self.floors[writer].chunk_size(config.SENDFILE_BLOCK_SIZE),
+                            stop - position)
+                sent = await self.send_limited(
+                    writer, self.loop.sendfile(writer.transport, f, position, count), count)
+                if not sent:
+                    break
+                position += sent
+                self.track(sent)
+            return
+
+        position = start
+        while position < stop:
+            data = await self.run_disk(read_at, f, position,
+                                       min(COPY_CHUNK_SIZE, stop - position))
+            if not data:
+                break
+            writer.write(data)
+            await self.drain(writer)
+            position += len(data)
+            self.track(len(data))
+
+    async def drain(self, writer):
+        """``writer.drain()`` within the client's send limits"""
+        pending = writer.transport.get_write_buffer_size()
+        if pending <= writer.transport.get_write_buffer_limits()[1]:
+            # Below the high-water mark drain does not wait
+            return await writer.drain()
+        await self.send_limited(writer, writer.drain(), pending)
+
+    async def send_limited(self, writer, aw, pending):
+        """Await a send of ``pending`` bytes, dropping clients that are too slow.
+
+        Progress inside a drain or sendfile is not visible, so the send may
+        take as long as the minimum rate allows for ``pending`` more bytes;
+        without a floor, WRITE_TIMEOUT.
+        """
+        floor = self.floors[writer]
+        floor.begin()
+        try:
+            timeout, reason = floor.remaining(pending), 'slow'
+            if timeout is None:
+                timeout, reason = config.WRITE_TIMEOUT, 'write'
+            try:
+                result = await asyncio.wait_for(aw, max(timeout, 0))
+            except asyncio.TimeoutError:
+                self.reap(writer, reason)
+                raise
+            floor.sent(pending)
+            return result
+        finally:
+            floor.end()
+
+    def expire(self, writer, reason):
+        """Drop a connection that broke a time limit; its pending read sees EOF"""
+        self.reap(writer, reason)
+        writer.transport.abort()
+
+    def reap(self, writer, reason):
+        peer = writer.get_extra_info('peername')
+        self.reaper.reap(peer[0] if peer else '?', reason)
+
+    def track(self, bytes_num):
+        if self.tracker:
+            self.tracker.add_download(bytes_num)
+
+
+def frame(data, chunked):
+    """Wrap ``data`` as one chunk when using chunked transfer coding"""
+    if chunked:
+        return b'%x\r\n' % len(data) + data + b'\r\n'
+    return data
+
+
+def read_at(f, offset, size):
+    f.seek(offset)
+    return f.read(size)
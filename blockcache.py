@@ -0,0 +1,171 @@
+"""
+In-memory block cache for hot files served by SecureShare Pro
+"""
+
+import collections
+import io
+import os
+import threading
+
+import config
+
+
+class BlockCache:
+    """Byte-bounded LRU of file blocks shared by every request thread.
+
+    Blocks are keyed by the file's identity (device, inode, size and
+    mtime), so a modified file is never served from stale blocks; the old
+    ones simply age out.  Only files up to ``max_file_size`` are admitted,
+    so a single large download cannot flush the hot set - those keep using
+    sendfile.
+    """
+
+    def __init__(self, max_bytes=None, block_size=None, max_file_size=None):
+        self.max_bytes = config.BLOCK_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.block_size = block_size or config.BLOCK_CACHE_BLOCK_SIZE
+        self.max_file_size = (config.BLOCK_CACHE_MAX_FILE_SIZE
+                              if max_file_size is None else max_file_size)
+        self.blocks = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # One loader per missing block; concurrent requests wait for it
+        self.loading = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(st):
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def cacheable(self, st):
+        return 0 < st.st_size <= self.max_file_size and self.max_bytes > 0
+
+    def open(self, path, st):
+        """A ``CachedFile`` for ``path`` when it qualifies, else the real file"""
+        if self.cacheable(st):
+            return CachedFile(self, path, st)
+        return open(path, 'rb')
+
+    def spans(self, start, stop):
+        """Yield ``(index, lo, hi)``: the slice of each block covering the range"""
+        size = self.block_size
+        for index in range(start // size, (stop + size - 1) // size):
+            base = index * size
+            yield index, max(start - base, 0), min(stop - base, size)
+
+    def get(self, st, index):
+        """The cached block, or None.  Never touches the disk."""
+        with self.lock:
+            data = self.blocks.get((self.key(st), index))
+            if data is not None:
+                self.blocks.move_to_end((self.key(st), index))
+                self.hits += 1
+            return data
+
+    def load(self, path, st, index):
+        """Read a block from disk into the cache and return it"""
+        block = (self.key(st), index)
+        with self.lock:
+            loader = self.loading.setdefault(block, threading.Lock())
+        with loader:
+            data = self.get(st, index)
+            if data is not None:
+                # Another request loaded it while we waited
+                return data
+            with self.lock:
+                self.misses += 1
+            try:
+                with open(path, 'rb', buffering=0) as f:
+                    data = os.pread(f.fileno(), self.block_size, index * self.block_size)
+                    current = self.key(os.fstat(f.fileno()))
+            finally:
+                with self.lock:
+                    self.loading.pop(block, None)
+
+            # A file replaced since it was stat'ed must not be cached
+            # under the old identity
+            if current == block[0]:
+                self.insert(block, data)
+            return data
+
+    def insert(self, block, data):
+        with self.lock:
+            if block in self.blocks:
+                return
+            self.blocks[block] = data
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes and self.blocks:
+                _, evicted = self.blocks.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def read(self, path, st, start, stop):
+        """Yield ``[start, stop)`` of the file as memoryviews of cached blocks"""
+        for index, lo, hi in self.spans(start, stop):
+            data = self.get(st, index)
+            if data is None:
+                data = self.load(path, st, index)
+            yield memoryview(data)[lo:hi]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'blocks': len(self.blocks),
+            }
+
+
+class CachedFile(io.RawIOBase):
+    """Read-only file whose contents come from a ``BlockCache``.
+
+    Stands in for the open file in the serving paths; it has no file
+    descriptor, so those paths skip sendfile and readahead hints.
+    """
+
+    def __init__(self, cache, path, st):
+        super().__init__()
+        self.cache = cache
+        self.path = path
+        self.st = st
+        self.size = st.st_size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(offset, 0)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def read(self, size=-1):
+        stop = self.size if size is None or size < 0 else min(self.position + size, self.size)
+        if self.position >= stop:
+            return b''
+        data = b''.join(self.cache.read(self.path, self.st, self.position, stop))
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def iter_range(self, start, stop):
+        """Yield ``[start, stop)`` without copying (``stop=None``: to EOF)"""
+        if stop is None:
+            stop = self.size
+        return self.cache.read(self.path, self.st, start, stop)
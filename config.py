@@ -14,6 +14,7 @@ AUTHOR = "Your Name"  # Change this to your name!
 BASE_DIR = Path(__file__).parent
 LOGS_DIR = BASE_DIR / "logs"
 ASSETS_DIR = BASE_DIR / "assets"
+CACHE_DIR = BASE_DIR / "cache"
 
 # Create directories if they don't exist
 LOGS_DIR.mkdir(exist_ok=True)
@@ -22,6 +23,64 @@ ASSETS_DIR.mkdir(exist_ok=True)
 # Server Settings
 DEFAULT_PORT = 8000
 PORT_RANGE = range(8000, 8100)  # Try ports in this range if default is busy
+SHARE_PORT = 5000  # Port main.py's shares try first (after the previous share's)
+SHARE_PORT_RANGE = range(5000, 5100)  # Then this range, then any free port
+MAX_BYTE_RANGES = 16  # Multi-range requests beyond this are coalesced
+HTTP_CACHE_MAX_AGE = 60  # Seconds clients/proxies may reuse a download unchecked
+SERVER_WORKERS = 32  # Concurrent connections FileServer handles at once
+SERVER_BACKLOG = 128  # Pending connections queued by the kernel when saturated
+# 'threaded' uses the worker pool above; 'asyncio' handles every connection
+# on one event loop, for thousands of concurrent (mostly idle) clients
+SERVER_ENGINE = 'threaded'
+ASYNC_DISK_THREADS = 4  # Threads doing file I/O for the asyncio engine
+# Processes serving the Flask app (main.py); above 1 the share runs on
+# pre-forked workers sharing the port (prefork.py, not on Windows)
+FLASK_WORKERS = 1
+# Where a share's download counts and log live (state.py): 'local' keeps
+# them in the serving process, 'sqlite' in a database every worker process
+# writes to; 'auto' uses sqlite only when serving from several processes
+STATE_BACKEND = 'auto'
+STATE_FLUSH_INTERVAL = 0.25  # Seconds a process batches statistics before writing them
+STATE_BATCH_SIZE = 256  # Pending statistics updates that force an early write
+KEEPALIVE_TIMEOUT = 15  # Seconds an idle persistent connection is kept open
+KEEPALIVE_MAX_REQUESTS = 100  # Requests served per connection before closing
+SERVER_MAX_IDLE = 1024  # Idle connections FileServer keeps open; oldest closed first
+HEADER_TIMEOUT = 10  # Seconds to receive a request's line and headers once it starts
+READ_TIMEOUT = 30  # Seconds a request body read may wait for data
+WRITE_TIMEOUT = 30  # Seconds a client may accept no response data before it is dropped
+MIN_SEND_RATE = 1024  # Bytes/s a downloading client must sustain (0 = no floor)
+SLOW_CLIENT_PERIOD = 30  # Seconds below MIN_SEND_RATE before a client is dropped
+LISTING_PAGE_SIZE = 500  # Entries per page of a directory listing
+LISTING_CACHE_DIRS = 64  # Directory snapshots kept for listings
+LISTING_CACHE_TTL = 30  # Seconds before a snapshot is rescanned anyway
+
+# Socket tuning profiles applied to every accepted connection (transport.py).
+# Omitted options keep the kernel default; for buffers that means
+# autotuning, and explicit sizes are capped by net.core.wmem_max/rmem_max.
+# 'cork' holds headers back so they share segments with the body.
+# 'tunnel' suits a connection that crosses a tunnel's slow link.  Shares
+# reached through ngrok do not use it: their connections come from the
+# local ngrok agent, and only the agent's upstream connection could use
+# this tuning.
+TRANSPORT_PROFILE = 'lan'
+TRANSPORT_PROFILES = {
+    'default': {},
+    'lan': {'nodelay': True, 'cork': True},
+    'wan': {
+        'nodelay': True,
+        'cork': True,
+        'sndbuf': 8 * 1024 * 1024,
+        'rcvbuf': 8 * 1024 * 1024,
+        'notsent_lowat': 256 * 1024,
+        'congestion': 'bbr',
+    },
+    'tunnel': {
+        'nodelay': True,
+        'cork': True,
+        'notsent_lowat': 16 * 1024,
+        'congestion': 'bbr',
+    },
+}
 
 # Ngrok Settings
 NGROK_AUTH_TOKEN = None  # Users can add their token for custom domains (optional)
@@ -29,6 +88,47 @@ NGROK_AUTH_TOKEN = None  # Users can add their token for custom domains (optiona
 # File Transfer Settings
 MAX_UPLOAD_SIZE = 500 * 1024 * 1024  # 500 MB max upload
 ALLOWED_FILE_TYPES = None  # None = all files allowed
+USE_SENDFILE = True  # Zero-copy file bodies via sendfile on plain sockets
+SENDFILE_BLOCK_SIZE = 8 * 1024 * 1024  # Bytes per sendfile call (stats granularity)
+FADVISE_ENABLED = True  # Readahead hints for downloads (posix_fadvise)
+FADVISE_WILLNEED_BYTES = 8 * 1024 * 1024  # Prefetched at the start of a transfer
+FADVISE_DONTNEED_MIN_SIZE = 256 * 1024 * 1024  # Bigger files leave the cache once sent
+WARM_CACHE_BUDGET = 1024 * 1024 * 1024  # Max bytes read by the "warm cache" step
+BLOCK_CACHE_MAX_BYTES = 256 * 1024 * 1024  # Memory for hot file blocks (0 = off)
+BLOCK_CACHE_BLOCK_SIZE = 1024 * 1024  # Unit cached and evicted
+BLOCK_CACHE_MAX_FILE_SIZE = 32 * 1024 * 1024  # Larger files are sent from disk
+
+# Archive Settings
+ARCHIVE_CHUNK_SIZE = 256 * 1024  # Read size when streaming archive members
+ZIP_COMPRESSION_LEVEL = 6  # zlib level used for deflated members
+ZIP_MIN_DEFLATE_SIZE = 512  # Smaller files are stored as-is
+ZIP_PROBE_SIZE = 64 * 1024  # Bytes trial-compressed to judge compressibility
+ZIP_PROBE_RATIO = 0.9  # Store members whose probe shrinks less than 10%
+ZIP_FAST_LEVEL_SIZE = 256 * 1024 * 1024  # Deflate larger members at level 1
+ARCHIVE_WORKERS = os.cpu_count() or 1  # Compression processes (1 = no pool)
+ARCHIVE_BLOCK_SIZE = 1024 * 1024  # Unit of work handed to each process
+ARCHIVE_PIPELINE_DEPTH = 8  # Chunks buffered between read/compress/send stages
+DEFAULT_ARCHIVE_FORMAT = 'zip'  # 'zip', 'tar', 'tar.gz' or 'tar.zst'
+TAR_GZIP_LEVEL = 6
+TAR_ZSTD_LEVEL = 3
+# 'auto' serves a resumable store-only ZIP when no member is worth deflating,
+# 'always' does so for every share, 'never' always builds a deflated ZIP
+ZIP_RESUMABLE_MODE = 'auto'
+ARCHIVE_LAYOUT_CACHE_SIZE = 8  # Share and subset ZIP layouts kept between requests
+ZIP_CRC_CACHE_SIZE = 4096  # File CRC-32s remembered for ZIP layouts
+ARCHIVE_CACHE_ENABLED = True  # Keep finished archives on disk for reuse
+ARCHIVE_CACHE_DIR = CACHE_DIR / "archives"
+ARCHIVE_CACHE_MAX_BYTES = 5 * 1024 * 1024 * 1024  # LRU eviction above 5 GB
+
+# Response Compression Settings
+RESPONSE_COMPRESSION = True  # Negotiate Accept-Encoding for compressible files
+COMPRESS_MIN_SIZE = 1024  # Smaller files are always sent as-is
+RESPONSE_GZIP_LEVEL = 6
+RESPONSE_ZSTD_LEVEL = 3
+RESPONSE_BROTLI_LEVEL = 5
+ENCODED_CACHE_DIR = CACHE_DIR / "encoded"
+ENCODED_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # LRU eviction above 1 GB
+ENCODED_PROBE_CACHE_SIZE = 4096  # Compressibility verdicts remembered per file
 
 # History Settings
 HISTORY_FILE = LOGS_DIR / "transfer_history.json"
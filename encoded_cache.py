@@ -0,0 +1,195 @@
+"""
+Response compression and precompressed sidecar cache for SecureShare Pro
+"""
+
+import collections
+import hashlib
+import json
+import os
+import threading
+import zlib
+from pathlib import Path
+
+import config
+from archive import ZSTD_OK, CompressionPolicy
+
+if ZSTD_OK:
+    import zstandard
+
+try:
+    import brotli
+    BROTLI_OK = True
+except ImportError:
+    BROTLI_OK = False
+
+
+# Content-coding -> sidecar file extension
+ENCODING_EXTENSIONS = {'br': '.br', 'zstd': '.zst', 'gzip': '.gz'}
+
+
+def available_encodings():
+    """Content-codings this install can produce, in order of preference"""
+    encodings = []
+    if BROTLI_OK:
+        encodings.append('br')
+    if ZSTD_OK:
+        encodings.append('zstd')
+    encodings.append('gzip')
+    return encodings
+
+
+class Encoder:
+    """Incremental compressor for one response body"""
+
+    def __init__(self, encoding):
+        if encoding == 'gzip':
+            # zlib writes a gzip header with no timestamp, so the output is
+            # reproducible and a resumed download matches its sidecar
+            obj = zlib.compressobj(config.RESPONSE_GZIP_LEVEL, zlib.DEFLATED,
+                                   16 + zlib.MAX_WBITS)
+            self.compress, self.flush = obj.compress, obj.flush
+        elif encoding == 'zstd' and ZSTD_OK:
+            obj = zstandard.ZstdCompressor(
+                level=config.RESPONSE_ZSTD_LEVEL).compressobj()
+            self.compress, self.flush = obj.compress, obj.flush
+        elif encoding == 'br' and BROTLI_OK:
+            obj = brotli.Compressor(quality=config.RESPONSE_BROTLI_LEVEL)
+            self.compress, self.flush = obj.process, obj.finish
+        else:
+            raise ValueError(f"Unsupported content-coding: {encoding}")
+
+
+class EncodedCache:
+    """Size-bounded cache of precompressed file variants.
+
+    Sidecars are keyed by file identity (path, inode, size, mtime) and
+    coding, so a changed file never serves a stale variant.  The first
+    request streams the compressed body and writes the sidecar alongside;
+    later requests send the sidecar like any plain file.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = Path(cache_dir or config.ENCODED_CACHE_DIR)
+        self.max_bytes = max_bytes or config.ENCODED_CACHE_MAX_BYTES
+        self.policy = CompressionPolicy()
+        # Probe verdicts by file identity, LRU
+        self.compressible = collections.OrderedDict()
+        self.writing = set()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(path, st, encoding):
+        """Hash the file identity plus the coding and its level"""
+        levels = {
+            'gzip': config.RESPONSE_GZIP_LEVEL,
+            'zstd': config.RESPONSE_ZSTD_LEVEL,
+            'br': config.RESPONSE_BROTLI_LEVEL,
+        }
+        identity = [os.path.abspath(path), st.st_ino, st.st_size,
+                    st.st_mtime_ns, encoding, levels.get(encoding)]
+        return hashlib.sha256(json.dumps(identity).encode('utf-8')).hexdigest()
+
+    def sidecar_path(self, path, st, encoding):
+        return self.cache_dir / (self.key(path, st, encoding)
+                                 + ENCODING_EXTENSIONS[encoding])
+
+    def should_encode(self, path, st):
+        """True if the file is worth compressing on the wire"""
+        if not config.RESPONSE_COMPRESSION or st.st_size < config.COMPRESS_MIN_SIZE:
+            return False
+        identity = (os.path.abspath(path), st.st_ino, st.st_size, st.st_mtime_ns)
+        with self.lock:
+            if identity in self.compressible:
+                self.compressible.move_to_end(identity)
+                return self.compressible[identity]
+        compressible = (not self.policy.is_incompressible_type(path)
+                        and self.policy.probe(path))
+        with self.lock:
+            self.compressible[identity] = compressible
+            while len(self.compressible) > config.ENCODED_PROBE_CACHE_SIZE:
+                self.compressible.popitem(last=False)
+        return compressible
+
+    def lookup(self, path, st, encoding):
+        """Return the finished sidecar for this file and coding, or None"""
+        sidecar = self.sidecar_path(path, st, encoding)
+        try:
+            os.utime(sidecar)
+        except OSError:
+            return None
+        return sidecar
+
+    def stream(self, path, st, encoding, chunk_size=None):
+        """Yield the compressed file, writing its sidecar on the way.
+
+        Only one request writes a given sidecar; concurrent requests for
+        the same variant just compress for themselves.  The sidecar is
+        discarded if the client disconnects or the file changes meanwhile.
+        """
+        chunk_size = chunk_size or config.ARCHIVE_CHUNK_SIZE
+        sidecar = self.sidecar_path(path, st, encoding)
+        tmp = sidecar.with_name(sidecar.name + '.tmp')
+        with self.lock:
+            tee = sidecar.name not in self.writing
+            if tee:
+                self.writing.add(sidecar.name)
+
+        out = None
+        try:
+            if tee:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                out = open(tmp, 'wb')
+            encoder = Encoder(encoding)
+            with open(path, 'rb') as f:
+                for data in iter(lambda: f.read(chunk_size), b''):
+                    data = encoder.compress(data)
+                    if data:
+                        if out:
+                            out.write(data)
+                        yield data
+                data = encoder.flush()
+                if out:
+                    out.write(data)
+                yield data
+                current = os.fstat(f.fileno())
+
+            if out:
+                out.close()
+                if (current.st_size, current.st_mtime_ns) == (st.st_size, st.st_mtime_ns):
+                    os.replace(tmp, sidecar)
+                    self.evict()
+        finally:
+            if out:
+                out.close()
+                try:
+                    tmp.unlink()
+                except OSError:
+                    pass
+            if tee:
+                with self.lock:
+                    self.writing.discard(sidecar.name)
+
+    def evict(self):
+        """Delete least recently used sidecars until under ``max_bytes``"""
+        entries = []
+        total = 0
+        for sidecar in self.cache_dir.iterdir():
+            if sidecar.suffix not in ENCODING_EXTENSIONS.values():
+                continue
+            try:
+                st = sidecar.stat()
+            except OSError:
+                continue
+            total += st.st_size
+            entries.append((st.st_mtime, sidecar, st.st_size))
+
+        entries.sort()
+        for used, sidecar, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                sidecar.unlink()
+            except OSError:
+                # Still open by a reader (Windows); try again next time
+                continue
+            total -= size
@@ -13,6 +13,7 @@ import webbrowser
 from pathlib import Path
 
 import config
+import ports
 import utils
 from server import FileServer
 from tunnel import TunnelManager
@@ -411,36 +412,45 @@ class SecureShareGUI:
         self.status_label.config(text="⏳ Starting server...", fg='orange')
         self.root.update()
 
-        # Find free port
-        port = utils.find_free_port(self.port.get())
-        if not port:
+        # Bind a port (the chosen one if free) and keep the socket for the
+        # server, so nothing can take the port in between
+        try:
+            sock = ports.acquire_socket(self.port.get(), config.PORT_RANGE)
+        except OSError:
             messagebox.showerror(
                 "Port Error", "❌ Could not find an available port!")
             self.start_btn.config(state=tk.NORMAL)
             self.status_label.config(text="⚫ Ready to share", fg='gray')
             return
 
+        port = ports.socket_port(sock)
         self.port.set(port)
 
         # Start server
         password = self.password.get() if self.password.get() else None
         self.server = FileServer(
             self.selected_path,
-            port,
             password=password,
-            activity_callback=self.log_activity
+            activity_callback=self.log_activity,
+            sock=sock
         )
 
-        if not self.server.start():
+        # The rest of the start-up runs once the server reports that it is
+        # listening (or failed to bind)
+        self.server.start()
+        self.server.ready.add_done_callback(
+            lambda f: self.root.after(0, self.server_ready, f, port, password))
+
+    def server_ready(self, ready, port, password):
+        """Finish starting the share once the server is up (or failed)"""
+        if ready.exception():
+            self.server = None
             messagebox.showerror(
                 "Server Error", "❌ Failed to start server!\n\nPlease try a different port.")
             self.start_btn.config(state=tk.NORMAL)
             self.status_label.config(text="⚫ Ready to share", fg='gray')
             return
 
-        # Small delay to ensure server is ready
-        time.sleep(0.5)
-
         # Generate URL
         local_ip = utils.get_local_ip()
         local_url = f"http://{local_ip}:{port}"
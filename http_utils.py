@@ -0,0 +1,281 @@
+"""
+HTTP helpers shared by both SecureShare Pro servers
+"""
+
+import base64
+import email.utils
+import secrets
+import unicodedata
+from urllib.parse import quote
+
+import config
+
+
+class RangeNotSatisfiable(Exception):
+    """None of the requested byte ranges overlap the resource"""
+
+    def __init__(self, length):
+        super().__init__(f"Range not satisfiable for {length} bytes")
+        self.length = length
+
+
+def http_date(timestamp):
+    """Format a POSIX timestamp as an HTTP-date"""
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(value):
+    """Parse an HTTP-date into a POSIX timestamp, or None if invalid"""
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def file_etag(st, encoding=None):
+    """Strong ETag derived from a file's identity (inode, size, mtime).
+
+    Each content-coding of the file is a different representation, so it
+    gets its own tag.
+    """
+    if encoding:
+        return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}-{encoding}"'
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def negotiate_encoding(header, available):
+    """Pick a content-coding from ``Accept-Encoding``, or None for identity.
+
+    ``available`` is in server preference order, which breaks ties
+    between codings the client weights equally.
+    """
+    if not header:
+        return None
+    weights = {}
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        weight = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    best = None
+    for encoding in available:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > 0 and (best is None or weight > best[0]):
+            best = (weight, encoding)
+    return best[1] if best else None
+
+
+def weak_etag(value):
+    """Weak ETag for content that is equivalent but not byte-identical"""
+    return f'W/"{value}"'
+
+
+def etag_matches(header, etag):
+    """Weak comparison of ``etag`` against an If-None-Match header"""
+    if header.strip() == '*':
+        return True
+
+    def opaque(tag):
+        tag = tag.strip()
+        return tag[2:] if tag.startswith('W/') else tag
+
+    return opaque(etag) in {opaque(tag) for tag in header.split(',')}
+
+
+def not_modified(if_none_match, if_modified_since, etag, mtime=None):
+    """Decide whether a GET/HEAD can be answered with 304 (RFC 7232).
+
+    If-None-Match takes precedence; If-Modified-Since is only consulted
+    when it is absent and the resource has a modification time.
+    """
+    if if_none_match:
+        return etag is not None and etag_matches(if_none_match, etag)
+    if if_modified_since and mtime is not None:
+        since = parse_http_date(if_modified_since)
+        return since is not None and int(mtime) <= int(since)
+    return False
+
+
+def cache_control(private):
+    """Cache-Control for shared content; password-protected shares stay private"""
+    scope = 'private' if private else 'public'
+    return f"{scope}, max-age={config.HTTP_CACHE_MAX_AGE}"
+
+
+def check_basic_auth(header, password):
+    """Check an ``Authorization: Basic`` header against the share password"""
+    try:
+        auth_type, auth_string = header.split(' ', 1)
+        if auth_type.lower() == 'basic':
+            decoded = base64.b64decode(auth_string).decode('utf-8')
+            username, supplied = decoded.split(':', 1)
+            return secrets.compare_digest(supplied.encode('utf-8'),
+                                          password.encode('utf-8'))
+    except Exception:
+        pass
+    return False
+
+
+def content_range(start, stop, length):
+    """Content-Range value for the half-open range ``[start, stop)``"""
+    return f"bytes {start}-{stop - 1}/{length}"
+
+
+def content_disposition(filename):
+    """Content-Disposition value for downloading ``filename`` (RFC 6266)"""
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename)
+        simple = simple.encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(filename, safe="!#$&+^`|~")
+        return f"attachment; filename=\"{simple}\"; filename*=UTF-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def parse_range_header(header, length):
+    """Parse a ``Range`` header against a resource of ``length`` bytes.
+
+    Returns a list of half-open ``(start, stop)`` pairs, or None when the
+    header is absent, malformed or not in bytes, in which case the whole
+    resource should be sent (RFC 7233 section 3.1).  Raises
+    ``RangeNotSatisfiable`` when no range overlaps the resource.
+    """
+    if not header:
+        return None
+    unit, sep, spec = header.partition('=')
+    if not sep or unit.strip().lower() != 'bytes':
+        return None
+
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition('-')
+        first, last = first.strip(), last.strip()
+        if not sep or (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+        if not first:
+            # Suffix range: the last N bytes
+            if not last:
+                return None
+            suffix = int(last)
+            if suffix == 0:
+                continue
+            ranges.append((max(length - suffix, 0), length))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= length:
+            continue
+        stop = int(last) + 1 if last else length
+        ranges.append((start, min(stop, length)))
+
+    if not ranges:
+        raise RangeNotSatisfiable(length)
+    return coalesce_ranges(ranges)
+
+
+def coalesce_ranges(ranges, max_ranges=None):
+    """Merge overlapping ranges, and all of them if there are too many.
+
+    Ranges are kept in the requested order unless some overlap, so clients
+    asking for disjoint segments get exactly the parts they asked for.
+    Collapsing long lists protects against many-tiny-ranges abuse.
+    """
+    max_ranges = max_ranges or config.MAX_BYTE_RANGES
+    ordered = sorted(ranges)
+    overlapping = any(ordered[i][0] < ordered[i - 1][1]
+                      for i in range(1, len(ordered)))
+    if not overlapping and len(ranges) <= max_ranges:
+        return ranges
+
+    merged = [list(ordered[0])]
+    for start, stop in ordered[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    if len(merged) > max_ranges:
+        return [(merged[0][0], merged[-1][1])]
+    return [tuple(r) for r in merged]
+
+
+def if_range_matches(header, etag, mtime):
+    """Evaluate ``If-Range``: True if a Range request may be honoured.
+
+    Only strong validators count: an exact ETag match, or a date equal to
+    the resource's Last-Modified time.
+    """
+    if not header:
+        return True
+    header = header.strip()
+    if header.startswith('W/'):
+        return False
+    if header.startswith('"'):
+        return etag is not None and header == etag
+    timestamp = parse_http_date(header)
+    return timestamp is not None and int(timestamp) == int(mtime)
+
+
+class MultipartRanges:
+    """Framing for a ``multipart/byteranges`` response body"""
+
+    def __init__(self, ranges, length, content_type):
+        self.boundary = secrets.token_hex(16)
+        self.content_type = f"multipart/byteranges; boundary={self.boundary}"
+        self.parts = []
+        for start, stop in ranges:
+            header = (
+                f"\r\n--{self.boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: {content_range(start, stop, length)}\r\n\r\n"
+            ).encode('latin-1')
+            self.parts.append((header, start, stop))
+        self.trailer = f"\r\n--{self.boundary}--\r\n".encode('latin-1')
+        self.content_length = len(self.trailer) + sum(
+            len(header) + stop - start for header, start, stop in self.parts)
+
+    def __iter__(self):
+        return iter(self.parts)
+
+
+def read_range(f, start, stop, chunk_size=None):
+    """Yield the bytes of ``f`` in ``[start, stop)``"""
+    chunk_size = chunk_size or config.ARCHIVE_CHUNK_SIZE
+    f.seek(start)
+    remaining = stop - start
+    while remaining > 0:
+        data = f.read(min(chunk_size, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+
+def iter_file_range(f, start, stop, chunk_size=None):
+    """Yield one byte range of ``f`` and close it afterwards"""
+    try:
+        yield from read_range(f, start, stop, chunk_size)
+    finally:
+        f.close()
+
+
+def iter_multipart(f, multipart, chunk_size=None):
+    """Yield a complete multipart/byteranges body and close ``f`` afterwards"""
+    try:
+        for header, start, stop in multipart:
+            yield header
+            yield from read_range(f, start, stop, chunk_size)
+        yield multipart.trailer
+    finally:
+        f.close()
@@ -0,0 +1,221 @@
+"""
+Cached, paginated directory listings for SecureShare Pro
+"""
+
+import collections
+import html
+import json
+import math
+import os
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+
+import config
+
+Entry = collections.namedtuple('Entry', 'name is_dir is_link size mtime')
+
+SORT_KEYS = {
+    'name': lambda e: e.name.lower(),
+    'size': lambda e: (e.size, e.name.lower()),
+    'mtime': lambda e: (e.mtime, e.name.lower()),
+}
+
+# Entries rendered per chunk of a streamed listing
+ENTRIES_PER_CHUNK = 200
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class DirectorySnapshot:
+    """One ``scandir`` pass over a directory, with sorted views on demand"""
+
+    def __init__(self, path):
+        self.path = path
+        st = os.stat(path)
+        self.mtime_ns = st.st_mtime_ns
+        self.scanned_at = time.monotonic()
+        self.entries = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    st = entry.stat()
+                    size, mtime = st.st_size, st.st_mtime
+                except OSError:
+                    # Broken symlink or vanished entry
+                    is_dir, size, mtime = False, 0, 0
+                self.entries.append(Entry(entry.name, is_dir, entry.is_symlink(),
+                                          size, mtime))
+        self.views = {}
+        self.lock = threading.Lock()
+
+    def sorted(self, key, reverse=False):
+        """Entries sorted by ``key``, computed once per snapshot"""
+        with self.lock:
+            view = self.views.get((key, reverse))
+            if view is None:
+                view = sorted(self.entries, key=SORT_KEYS[key], reverse=reverse)
+                self.views[(key, reverse)] = view
+            return view
+
+    def is_current(self, st):
+        """True while the directory is unchanged and the snapshot is fresh.
+
+        Adding, removing or renaming entries changes the directory mtime;
+        the TTL catches files that are modified in place.
+        """
+        age = time.monotonic() - self.scanned_at
+        return st.st_mtime_ns == self.mtime_ns and age < config.LISTING_CACHE_TTL
+
+
+class ListingCache:
+    """LRU of directory snapshots shared by every request"""
+
+    def __init__(self, max_dirs=None):
+        self.max_dirs = max_dirs or config.LISTING_CACHE_DIRS
+        self.snapshots = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        """Return a current snapshot of ``path``, rescanning if it changed"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self.lock:
+            snapshot = self.snapshots.get(path)
+            if snapshot and snapshot.is_current(st):
+                self.snapshots.move_to_end(path)
+                return snapshot
+
+        snapshot = DirectorySnapshot(path)
+        with self.lock:
+            self.snapshots[path] = snapshot
+            self.snapshots.move_to_end(path)
+            while len(self.snapshots) > self.max_dirs:
+                self.snapshots.popitem(last=False)
+        return snapshot
+
+
+class ListingPage:
+    """One page of a directory listing, rendered as HTML or JSON chunks.
+
+    The query string selects ``page`` (1-based), ``sort`` (name, size or
+    mtime), ``order`` (asc or desc) and ``format`` (html or json).
+    """
+
+    def __init__(self, snapshot, url_path, query='', page_size=None):
+        params = urllib.parse.parse_qs(query)
+
+        def param(name, default):
+            return params.get(name, [default])[0]
+
+        self.url_path = url_path
+        self.page_size = page_size or config.LISTING_PAGE_SIZE
+        self.sort = param('sort', 'name')
+        if self.sort not in SORT_KEYS:
+            self.sort = 'name'
+        self.order = 'desc' if param('order', 'asc') == 'desc' else 'asc'
+        self.format = 'json' if param('format', 'html') == 'json' else 'html'
+        self.total = len(snapshot.entries)
+        self.pages = max(math.ceil(self.total / self.page_size), 1)
+        try:
+            self.page = min(max(int(param('page', '1')), 1), self.pages)
+        except ValueError:
+            self.page = 1
+
+        entries = snapshot.sorted(self.sort, reverse=self.order == 'desc')
+        start = (self.page - 1) * self.page_size
+        self.entries = entries[start:start + self.page_size]
+
+    @property
+    def content_type(self):
+        if self.format == 'json':
+            return 'application/json'
+        return 'text/html; charset=utf-8'
+
+    def __iter__(self):
+        if self.format == 'json':
+            return self.iter_json()
+        return self.iter_html()
+
+    def link(self, **changes):
+        params = {'sort': self.sort, 'order': self.order, 'page': self.page}
+        params.update(changes)
+        return '?' + urllib.parse.urlencode(params)
+
+    def iter_html(self):
+        try:
+            display_path = urllib.parse.unquote(self.url_path, errors='surrogatepass')
+        except UnicodeDecodeError:
+            display_path = urllib.parse.unquote(self.url_path)
+        title = f"Directory listing for {html.escape(display_path, quote=False)}"
+
+        sort_links = []
+        for key in SORT_KEYS:
+            order = 'desc' if key == self.sort and self.order == 'asc' else 'asc'
+            sort_links.append(f'<a href="{html.escape(self.link(sort=key, order=order, page=1))}">'
+                              f'{key}</a>')
+        yield '\n'.join([
+            '<!DOCTYPE HTML>',
+            '<html lang="en">',
+            '<head>',
+            '<meta charset="utf-8">',
+            f'<title>{title}</title>\n</head>',
+            f'<body>\n<h1>{title}</h1>',
+            f'<p>{self.total} entries &middot; sort by {" | ".join(sort_links)}</p>',
+            '<hr>\n<ul>\n',
+        ]).encode('utf-8', 'surrogateescape')
+
+        for i in range(0, len(self.entries), ENTRIES_PER_CHUNK):
+            lines = []
+            for entry in self.entries[i:i + ENTRIES_PER_CHUNK]:
+                display_name = link_name = entry.name
+                if entry.is_dir:
+                    display_name = link_name = entry.name + "/"
+                if entry.is_link:
+                    display_name = entry.name + "@"
+                details = '' if entry.is_dir else f' <small>{format_size(entry.size)}</small>'
+                lines.append('<li><a href="%s">%s</a>%s</li>\n' % (
+                    urllib.parse.quote(link_name, errors='surrogatepass'),
+                    html.escape(display_name, quote=False), details))
+            yield ''.join(lines).encode('utf-8', 'surrogateescape')
+
+        nav = [f'Page {self.page} of {self.pages}']
+        if self.page > 1:
+            nav.insert(0, f'<a href="{html.escape(self.link(page=self.page - 1))}">&laquo; Previous</a>')
+        if self.page < self.pages:
+            nav.append(f'<a href="{html.escape(self.link(page=self.page + 1))}">Next &raquo;</a>')
+        yield f'</ul>\n<hr>\n<p>{" &middot; ".join(nav)}</p>\n</body>\n</html>\n'.encode('utf-8')
+
+    def iter_json(self):
+        header = {
+            'path': self.url_path,
+            'page': self.page,
+            'pages': self.pages,
+            'page_size': self.page_size,
+            'total': self.total,
+            'sort': self.sort,
+            'order': self.order,
+        }
+        yield (json.dumps(header)[:-1] + ', "entries": [').encode('utf-8')
+        for i in range(0, len(self.entries), ENTRIES_PER_CHUNK):
+            items = []
+            for entry in self.entries[i:i + ENTRIES_PER_CHUNK]:
+                items.append(json.dumps({
+                    'name': entry.name,
+                    'type': 'dir' if entry.is_dir else 'file',
+                    'size': entry.size,
+                    'mtime': datetime.fromtimestamp(entry.mtime).isoformat(timespec='seconds'),
+                    'href': urllib.parse.quote(entry.name + ('/' if entry.is_dir else ''),
+                                               errors='surrogatepass'),
+                }, ensure_ascii=True))
+            prefix = ', ' if i else ''
+            yield (prefix + ', '.join(items)).encode('utf-8')
+        yield b']}\n'
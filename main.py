@@ -3,20 +3,40 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import socket
 import threading
+import multiprocessing
 import qrcode
 import os
-import zipfile
-import io
 import secrets
 import time
 import json
+import hashlib
+import mimetypes
 import subprocess
 import platform
 import sys
+import argparse
 from PIL import Image, ImageTk
-from flask import Flask, send_file, render_template_string, request, session, redirect, url_for
+from flask import Flask, Response, render_template_string, request, session, redirect, url_for
 from datetime import datetime, timedelta
 from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.serving import WSGIRequestHandler
+from werkzeug.wsgi import wrap_file
+
+import config
+import http_utils
+import pagecache
+from pagecache import CacheWarmer
+from archive import (ARCHIVE_FORMATS, TAR_COMPRESSION, TarStream, ZipStream,
+                     available_formats)
+from archive_cache import ArchiveCache
+from blockcache import BlockCache
+from encoded_cache import EncodedCache, available_encodings
+from ports import socket_port
+from prefork import PREFORK_OK
+from reaper import Reaper, ReapingRequestHandler
+from share_server import ShareServer
+from state import LocalState, open_state
+from transport import TransportTuner
 
 try:
     from pyngrok import ngrok
@@ -29,11 +49,29 @@ app.secret_key = secrets.token_hex(16)
 app_data = {
     'files': [],
     'password_hash': None,
-    'download_count': 0,
     'start_time': None,
-    'unique_ips': set(),
-    'download_log': []
+    # Download count, visitors and download log (state.py)
+    'state': LocalState(),
+    'file_ids': {},
+    'archive_format': config.DEFAULT_ARCHIVE_FORMAT,
+    'transport': TransportTuner()
 }
+archive_cache = ArchiveCache()
+encoded_cache = EncodedCache()
+block_cache = BlockCache()
+client_reaper = Reaper()
+
+
+class TunedRequestHandler(ReapingRequestHandler, WSGIRequestHandler):
+    """Werkzeug request handler that applies the share's socket tuning and
+    drops idle, stalled and slowloris clients"""
+
+    reaper = client_reaper
+
+    def setup(self):
+        super().setup()
+        app_data['transport'].tune(self.connection)
+
 
 # Beautiful mobile-optimized HTML template
 HTML_TEMPLATE = """<!DOCTYPE html>
@@ -226,7 +264,36 @@ HTML_TEMPLATE = """<!DOCTYPE html>
             font-size: 0.9rem;
         }
 
+        .format-row {
+            color: var(--sub);
+            font-weight: 600;
+        }
+
+        .format-select {
+            margin-left: 8px;
+            padding: 8px 12px;
+            border: 2px solid var(--card);
+            border-radius: 10px;
+            background: var(--bg);
+            color: var(--txt);
+            font-size: 1rem;
+        }
+
+        .file-check {
+            width: 22px;
+            height: 22px;
+            margin-right: 15px;
+            accent-color: var(--g1);
+            cursor: pointer;
+        }
+
+        .download-btn:disabled {
+            opacity: 0.5;
+            cursor: not-allowed;
+        }
+
         .badge {
+            text-decoration: none;
             display: inline-block;
             padding: 6px 12px;
             background: linear-gradient(135deg, var(--ok), #059669);
@@ -355,20 +422,38 @@ HTML_TEMPLATE = """<!DOCTYPE html>
             {% endif %}
         </div>
         {% else %}
-        <div class="file-box">
+        <form class="file-box" method="GET" action="/download/selected" id="select-form">
             <h3>📦 {{file_count}} File(s) Ready</h3>
             {% for file in files %}
             <div class="file-item">
+                {% if file_count > 1 %}
+                <input type="checkbox" class="file-check" name="id" value="{{file.id}}" onchange="updateSelection()">
+                {% endif %}
                 <div class="file-info">
                     <div class="file-name">📄 {{file.name}}</div>
                     <div class="file-size">{{file.size}}</div>
                 </div>
-                <span class="badge">Ready</span>
+                <a href="/file/{{file.id}}" class="badge">⬇️ Get</a>
             </div>
             {% endfor %}
             <p class="success">✅ Ready to download!</p>
+            {% if file_count > 1 %}
+            <button type="submit" class="download-btn" id="selected-btn" disabled>
+                ⬇️ Download Selected (<span id="selected-count">0</span>)
+            </button>
+            {% endif %}
+        </form>
+        {% if file_count > 1 %}
+        <div class="format-row">
+            <label for="format-select">📦 Archive format:</label>
+            <select id="format-select" name="format" form="select-form" class="format-select" onchange="updateFormat()">
+                {% for fmt in formats %}
+                <option value="{{fmt}}" {% if fmt == archive_format %}selected{% endif %}>.{{fmt}}</option>
+                {% endfor %}
+            </select>
         </div>
-        <a href="/download" class="download-btn">
+        {% endif %}
+        <a href="/download{% if file_count > 1 %}?format={{archive_format}}{% endif %}" class="download-btn" id="download-all">
             ⬇️ Download {% if file_count > 1 %}All Files{% else %}File{% endif %}
         </a>
         {% endif %}
@@ -396,6 +481,17 @@ HTML_TEMPLATE = """<!DOCTYPE html>
             }
         }
 
+        function updateSelection() {
+            const count = document.querySelectorAll('.file-check:checked').length;
+            document.getElementById('selected-count').textContent = count;
+            document.getElementById('selected-btn').disabled = count === 0;
+        }
+
+        function updateFormat() {
+            const fmt = document.getElementById('format-select').value;
+            document.getElementById('download-all').href = '/download?format=' + encodeURIComponent(fmt);
+        }
+
         // Load saved theme
         window.addEventListener('DOMContentLoaded', () => {
             const savedTheme = localStorage.getItem('theme');
@@ -425,6 +521,22 @@ def get_uptime():
     return "0s"
 
 
+def file_id(file_path):
+    """Stable, opaque URL id for a shared file"""
+    digest = hashlib.sha1(os.path.abspath(file_path).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def index_files(files):
+    """Map URL ids to the shared file paths"""
+    return {file_id(f): f for f in files}
+
+
+def is_authorized():
+    """True if no password is set or this session has unlocked the share"""
+    return not app_data['password_hash'] or session.get('authenticated')
+
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     """Main page with file list"""
@@ -443,9 +555,8 @@ def index():
                 error="Incorrect password!",
                 files=[],
                 file_count=0,
-                downloads=app_data['download_count'],
-                users=len(app_data['unique_ips']),
-                uptime=get_uptime()
+                uptime=get_uptime(),
+                **app_data['state'].stats()
             )
 
     # Check if password is required and user is not authenticated
@@ -456,13 +567,12 @@ def index():
             error=None,
             files=[],
             file_count=0,
-            downloads=app_data['download_count'],
-            users=len(app_data['unique_ips']),
-            uptime=get_uptime()
+            uptime=get_uptime(),
+            **app_data['state'].stats()
         )
 
     # Track unique IPs
-    app_data['unique_ips'].add(request.remote_addr)
+    app_data['state'].add_visitor(request.remote_addr)
 
     # Prepare file information
     file_info = []
@@ -472,6 +582,7 @@ def index():
             size_str = f"{size / (1024*1024):.2f} MB" if size > 1024 * \
                 1024 else f"{size / 1024:.2f} KB"
             file_info.append({
+                'id': file_id(file_path),
                 'name': os.path.basename(file_path),
                 'size': size_str
             })
@@ -482,30 +593,177 @@ def index():
         error=None,
         files=file_info,
         file_count=len(file_info),
-        downloads=app_data['download_count'],
-        users=len(app_data['unique_ips']),
-        uptime=get_uptime()
+        formats=available_formats(),
+        archive_format=app_data['archive_format'],
+        uptime=get_uptime(),
+        **app_data['state'].stats()
+    )
+
+
+def record_download(rv):
+    """Count and log a download, then return the response unchanged.
+
+    HEAD probes, 304s and range requests that resume or split a transfer
+    are not counted, so download managers do not inflate the statistics.
+    """
+    if request.method == 'HEAD' or rv.status_code not in (200, 206):
+        return rv
+    byte_range = request.headers.get('Range', '').replace(' ', '')
+    if byte_range and not byte_range.startswith('bytes=0-'):
+        return rv
+
+    app_data['state'].add_download(request.remote_addr)
+    return rv
+
+
+def cache_headers(etag, mtime=None):
+    """Validator and Cache-Control headers for a download"""
+    headers = {
+        'ETag': etag,
+        'Cache-Control': http_utils.cache_control(
+            private=app_data['password_hash'] is not None)
+    }
+    if mtime is not None:
+        headers['Last-Modified'] = http_utils.http_date(mtime)
+    return headers
+
+
+def is_not_modified(etag, mtime=None):
+    """Evaluate If-None-Match / If-Modified-Since for this request"""
+    return http_utils.not_modified(
+        request.headers.get('If-None-Match'),
+        request.headers.get('If-Modified-Since'),
+        etag,
+        mtime
     )
 
 
+def send_ranged(open_file, length, etag, mtime, mimetype, download_name):
+    """Send a seekable resource with validators, Range and HEAD support.
+
+    ``open_file`` is only called when a body is actually sent, so a HEAD
+    request costs no more than the stat that produced ``length``.
+    """
+    headers = cache_headers(etag, mtime)
+    if is_not_modified(etag, mtime):
+        return Response(status=304, headers=headers)
+
+    headers['Accept-Ranges'] = 'bytes'
+    headers['Content-Disposition'] = http_utils.content_disposition(download_name)
+
+    ranges = None
+    if http_utils.if_range_matches(request.headers.get('If-Range'), etag, mtime):
+        try:
+            ranges = http_utils.parse_range_header(
+                request.headers.get('Range'), length)
+        except http_utils.RangeNotSatisfiable:
+            headers['Content-Range'] = f'bytes */{length}'
+            return Response(status=416, headers=headers)
+
+    multipart = None
+    content_type = mimetype
+    if ranges is None:
+        status, content_length = 200, length
+    elif len(ranges) == 1:
+        start, stop = ranges[0]
+        status, content_length = 206, stop - start
+        headers['Content-Range'] = http_utils.content_range(start, stop, length)
+    else:
+        multipart = http_utils.MultipartRanges(ranges, length, mimetype)
+        status, content_length = 206, multipart.content_length
+        content_type = multipart.content_type
+
+    body = ()
+    if request.method != 'HEAD':
+        f = open_file()
+        if multipart:
+            hint = pagecache.SendHint(f, min(start for _, start, _ in multipart),
+                                      max(stop for _, _, stop in multipart))
+            body = http_utils.iter_multipart(f, multipart)
+        elif ranges:
+            hint = pagecache.SendHint(f, start, stop)
+            body = http_utils.iter_file_range(f, start, stop)
+        else:
+            hint = pagecache.SendHint(f, 0, length)
+            body = wrap_file(request.environ, f, config.ARCHIVE_CHUNK_SIZE)
+        body = pagecache.hinted(body, hint)
+
+    rv = Response(body, status=status, content_type=content_type,
+                  headers=headers, direct_passthrough=True)
+    rv.content_length = content_length
+    return rv
+
+
+def send_path(file_path, download_name, mimetype=None):
+    """Send a file on disk through ``send_ranged``.
+
+    Compressible files are sent with the best coding the client accepts:
+    from the sidecar cache when it has the variant, otherwise compressed on
+    the fly.  Range requests are only compressed from a finished sidecar.
+    """
+    st = os.stat(file_path)
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+
+    compressible = encoded_cache.should_encode(file_path, st)
+    encoding = None
+    if compressible:
+        encoding = http_utils.negotiate_encoding(
+            request.headers.get('Accept-Encoding'), available_encodings())
+
+    if encoding:
+        sidecar = encoded_cache.lookup(file_path, st, encoding)
+        etag = http_utils.file_etag(st, encoding)
+        if sidecar:
+            sidecar_st = sidecar.stat()
+            rv = send_ranged(
+                lambda: block_cache.open(sidecar, sidecar_st),
+                sidecar_st.st_size,
+                etag,
+                st.st_mtime,
+                mimetype,
+                download_name
+            )
+        elif 'Range' not in request.headers:
+            rv = send_encoded(file_path, st, encoding, etag, mimetype, download_name)
+        else:
+            encoding = None
+
+    if not encoding:
+        rv = send_ranged(
+            lambda: block_cache.open(file_path, st),
+            st.st_size,
+            http_utils.file_etag(st),
+            st.st_mtime,
+            mimetype,
+            download_name
+        )
+
+    if compressible:
+        rv.headers['Vary'] = 'Accept-Encoding'
+        if encoding and rv.status_code in (200, 206):
+            rv.headers['Content-Encoding'] = encoding
+    return rv
+
+
+def send_encoded(file_path, st, encoding, etag, mimetype, download_name):
+    """Stream a file compressed on the fly, filling its sidecar"""
+    headers = cache_headers(etag, st.st_mtime)
+    if is_not_modified(etag, st.st_mtime):
+        return Response(status=304, headers=headers)
+    headers['Content-Disposition'] = http_utils.content_disposition(download_name)
+    # HEAD responses never iterate the body, so nothing is compressed
+    return Response(encoded_cache.stream(file_path, st, encoding),
+                    mimetype=mimetype, headers=headers)
+
+
 @app.route('/download')
 def download():
     """Handle file downloads"""
     # Check authentication
-    if app_data['password_hash'] and not session.get('authenticated'):
+    if not is_authorized():
         return redirect(url_for('index'))
 
-    # Increment download count
-    app_data['download_count'] += 1
-
-    # Log download
-    now = datetime.now()
-    app_data['download_log'].append({
-        'ip': request.remote_addr,
-        'time': now.strftime('%I:%M:%S %p'),
-        'date': now.strftime('%d-%b-%Y')
-    })
-
     files = app_data['files']
 
     if not files:
@@ -515,46 +773,142 @@ def download():
     if len(files) == 1:
         file_path = files[0]
         if os.path.exists(file_path):
-            return send_file(
-                file_path,
-                as_attachment=True,
-                download_name=os.path.basename(file_path)
-            )
+            return record_download(send_path(file_path, os.path.basename(file_path)))
         else:
             return "File not found", 404
 
-    # Multiple files - create ZIP
-    try:
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for file_path in files:
-                if os.path.exists(file_path):
-                    zip_file.write(file_path, os.path.basename(file_path))
-
-        zip_buffer.seek(0)
-        zip_name = f'ShareFast_{now.strftime("%d%b%Y_%I%M%p")}.zip'
-
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=zip_name
-        )
-    except Exception as e:
-        return f"Error creating ZIP: {e}", 500
+    return record_download(send_archive(files, use_cache=True))
+
+
+@app.route('/file/<fid>')
+def download_file(fid):
+    """Download one shared file by its id"""
+    if not is_authorized():
+        return redirect(url_for('index'))
+
+    file_path = app_data['file_ids'].get(fid)
+    if not file_path or not os.path.exists(file_path):
+        return "File not found", 404
+
+    return record_download(send_path(file_path, os.path.basename(file_path)))
+
+
+@app.route('/download/selected')
+def download_selected():
+    """Download an archive of the files picked on the listing page"""
+    if not is_authorized():
+        return redirect(url_for('index'))
+
+    selected = set(request.args.getlist('id'))
+    files = [path for fid, path in app_data['file_ids'].items()
+             if fid in selected]
+    if not files:
+        return "No files selected", 404
 
+    if len(files) == 1:
+        return record_download(send_path(files[0], os.path.basename(files[0])))
+    # Subsets are one-off, so stream them instead of filling the cache
+    return record_download(send_archive(files, use_cache=False))
+
+
+def choose_archive_format():
+    """Pick the archive format from ?format=, then Accept, then the default"""
+    formats = available_formats()
+    requested = request.args.get('format', '').lower()
+    if requested in formats:
+        return requested
+
+    # Only an explicitly listed archive type counts, not a */* wildcard
+    accepted = {ARCHIVE_FORMATS[fmt][0]: fmt for fmt in formats}
+    for mimetype, quality in request.accept_mimetypes:
+        if mimetype in accepted and quality > 0:
+            return accepted[mimetype]
+
+    default = app_data.get('archive_format', config.DEFAULT_ARCHIVE_FORMAT)
+    return default if default in formats else 'zip'
+
+
+def send_archive(files, use_cache):
+    """Send an archive of ``files`` in the negotiated format.
+
+    ZIPs use the resumable layout once it is ready, the archive cache or
+    a live stream; tar formats are always streamed.
+    """
+    fmt = choose_archive_format()
+    mimetype, extension = ARCHIVE_FORMATS[fmt]
+    now = datetime.now()
+    archive_name = f'ShareFast_{now.strftime("%d%b%Y_%I%M%p")}{extension}'
+
+    # Every representation of a manifest shares one ETag value: strong
+    # when the bytes are fixed (a layout, or the cached archive whether
+    # finished or still being written), weak for a live stream, which is
+    # equivalent but not guaranteed byte-identical
+    layout = None
+    if fmt == 'zip':
+        layout = archive_cache.get_layout(files)
+    key = ArchiveCache.manifest_key(files, 'zip-stored' if layout else fmt)
+    etag, weak_etag = f'"{key}"', http_utils.weak_etag(key)
+
+    # In 'auto' mode, checksumming the share must not hold back the first
+    # byte: stream until the layout is ready in the background
+    if layout and (layout.ready or config.ZIP_RESUMABLE_MODE == 'always'):
+        return send_ranged(layout.open, layout.size, etag,
+                           layout.mtime, mimetype, archive_name)
+
+    # A HEAD probe or a revalidation answers from what already exists:
+    # neither is a reason to build the archive or checksum the share
+    head = request.method == 'HEAD'
+    not_modified = is_not_modified(weak_etag)
+    build = None
+    if layout:
+        if not head and not not_modified:
+            layout.prepare_in_background()
+    elif fmt == 'zip' and use_cache and config.ARCHIVE_CACHE_ENABLED:
+        if head or not_modified:
+            build = archive_cache.find(files)
+        else:
+            # None while another worker process builds the archive
+            build = archive_cache.get(files)
+
+    if build and build.ok:
+        st = build.path.stat()
+        return send_ranged(lambda: block_cache.open(build.path, st), st.st_size,
+                           etag, st.st_mtime, mimetype, archive_name)
+
+    headers = cache_headers(etag if build else weak_etag)
+    if not_modified:
+        return Response(status=304, headers=headers)
+    headers['Content-Disposition'] = http_utils.content_disposition(archive_name)
+
+    if head:
+        # An empty iterator rather than no body: the length is not known
+        # yet, so no Content-Length: 0
+        return Response(iter(()), mimetype=mimetype, headers=headers)
+    if fmt != 'zip':
+        body = TarStream(files, TAR_COMPRESSION[fmt])
+    elif build is None:
+        body = ZipStream(files)
+    else:
+        body = build.iter_chunks()
+
+    return Response(body, mimetype=mimetype, headers=headers)
 
 class ShareFastGUI:
-    def __init__(self, root):
+    def __init__(self, root, workers=None):
         self.root = root
         self.files = []
         self.port = None
         self.sharing = False
-        self.flask_thread = None
+        self.workers = workers or config.FLASK_WORKERS
+        # CRITICAL: host='0.0.0.0' allows mobile devices on LAN to connect
+        self.share_server = ShareServer(app, '0.0.0.0', TunedRequestHandler)
         self.ngrok_tunnel = None
         self.timer_thread = None
         self.exp_time = None
+        self.archive_build = None
+        self.cache_warmer = None
         self.history_file = "sharefast_history.json"
+        self.history_entry = None
 
         root.title("⚡ ShareFast Pro v5.1 - Professional Edition")
         root.geometry("800x950")
@@ -786,6 +1140,49 @@ class ShareFastGUI:
         tk.Label(timer_row, text="minutes", font=(
             "Arial", 9)).pack(side=tk.LEFT)
 
+        format_row = tk.Frame(config_card)
+        format_row.pack(fill=tk.X, pady=4)
+
+        tk.Label(format_row, text="📦 Archive format:",
+                 font=("Arial", 9, "bold")).pack(side=tk.LEFT)
+        self.format_var = tk.StringVar(value=config.DEFAULT_ARCHIVE_FORMAT)
+        ttk.Combobox(
+            format_row,
+            textvariable=self.format_var,
+            values=available_formats(),
+            state='readonly',
+            width=10,
+            font=("Arial", 9)
+        ).pack(side=tk.LEFT, padx=8)
+        tk.Label(format_row, text="(for multi-file downloads)", font=(
+            "Arial", 8), fg='gray').pack(side=tk.LEFT)
+
+        workers_row = tk.Frame(config_card)
+        workers_row.pack(fill=tk.X, pady=4)
+
+        tk.Label(workers_row, text="🧵 Server processes:",
+                 font=("Arial", 9, "bold")).pack(side=tk.LEFT)
+        self.workers_var = tk.IntVar(value=self.workers if PREFORK_OK else 1)
+        tk.Spinbox(
+            workers_row,
+            from_=1,
+            to=max(os.cpu_count() or 1, 2) * 2,
+            textvariable=self.workers_var,
+            width=8,
+            font=("Arial", 9),
+            state='normal' if PREFORK_OK else 'disabled'
+        ).pack(side=tk.LEFT, padx=8)
+        tk.Label(workers_row, text="(more for many simultaneous downloads)", font=(
+            "Arial", 8), fg='gray').pack(side=tk.LEFT)
+
+        self.warm_cache_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            config_card,
+            text="🔥 Warm cache (preload files into memory for the first downloads)",
+            variable=self.warm_cache_var,
+            font=("Arial", 9, "bold")
+        ).pack(anchor=tk.W, pady=3)
+
         self.password_var = tk.BooleanVar()
         tk.Checkbutton(
             config_card,
@@ -888,6 +1285,22 @@ class ShareFastGUI:
         )
         self.stats_label.pack(pady=3)
 
+        self.archive_label = tk.Label(
+            status_card,
+            text="",
+            font=("Arial", 8, "bold"),
+            fg='#764ba2'
+        )
+        self.archive_label.pack()
+
+        self.warm_label = tk.Label(
+            status_card,
+            text="",
+            font=("Arial", 8, "bold"),
+            fg='#e67e22'
+        )
+        self.warm_label.pack()
+
         tk.Label(
             status_card,
             text="📎 Share These Links:",
@@ -1037,17 +1450,6 @@ class ShareFastGUI:
         except:
             return "127.0.0.1"
 
-    def find_free_port(self):
-        """Find available port"""
-        for port in range(5000, 5100):
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.bind(('', port))
-                    return port
-            except:
-                continue
-        return 5000
-
     def generate_qr(self, url):
         """Generate QR code"""
         try:
@@ -1106,12 +1508,40 @@ class ShareFastGUI:
         while True:
             if self.sharing and app_data['start_time']:
                 uptime_secs = int(time.time() - app_data['start_time'])
-                downloads = app_data['download_count']
-                users = len(app_data['unique_ips'])
-
-                text = f"📊 Downloads: {downloads} | 👥 Users: {users} | ⏱️ Uptime: {uptime_secs}s"
+                stats = app_data['state'].stats()
+
+                text = (f"📊 Downloads: {stats['downloads']} | 👥 Users: {stats['users']}"
+                        f" | ⏱️ Uptime: {uptime_secs}s")
+                cache = block_cache.stats()
+                if cache['hits'] or cache['misses']:
+                    text += (f" | ⚡ Memory: {cache['hit_rate']:.0%} hits, "
+                             f"{cache['bytes'] / 1024 / 1024:.0f} MB")
+                reaped = client_reaper.stats()['reaped']
+                dropped = sum(n for reason, n in reaped.items() if reason != 'idle')
+                if dropped:
+                    text += f" | 🐢 Dropped slow clients: {dropped}"
                 self.root.after(
                     0, lambda t=text: self.stats_label.config(text=t))
+
+                build = self.archive_build
+                if build:
+                    if build.ok:
+                        text = "📦 ZIP archive ready"
+                    elif build.done:
+                        text = "⚠️ ZIP pre-build failed (built on demand)"
+                    else:
+                        text = f"📦 Preparing ZIP archive: {build.progress:.0%}"
+                    self.root.after(
+                        0, lambda t=text: self.archive_label.config(text=t))
+
+                warmer = self.cache_warmer
+                if warmer:
+                    if warmer.done:
+                        text = f"🔥 Cache warm ({warmer.warmed / 1024 / 1024:.0f} MB)"
+                    else:
+                        text = f"🔥 Warming cache: {warmer.progress:.0%}"
+                    self.root.after(
+                        0, lambda t=text: self.warm_label.config(text=t))
             time.sleep(1)
 
     def save_history(self, url, mode):
@@ -1138,10 +1568,28 @@ class ShareFastGUI:
 
             with open(self.history_file, 'w') as f:
                 json.dump(history, f, indent=2)
+            self.history_entry = entry['timestamp']
 
         except Exception as e:
             print(f"Failed to save history: {e}")
 
+    def record_downloads(self, downloads):
+        """Store the finished share's download count in its history entry"""
+        if not self.history_entry:
+            return
+        try:
+            with open(self.history_file, 'r') as f:
+                history = json.load(f)
+            for entry in reversed(history):
+                if entry.get('timestamp') == self.history_entry:
+                    entry['downloads'] = downloads
+                    break
+            with open(self.history_file, 'w') as f:
+                json.dump(history, f, indent=2)
+        except Exception as e:
+            print(f"Failed to save history: {e}")
+        self.history_entry = None
+
     def show_analytics(self):
         """Show analytics dashboard"""
         if not os.path.exists(self.history_file):
@@ -1390,33 +1838,73 @@ class ShareFastGUI:
 
         # Setup app data
         app_data['files'] = self.files
+        app_data['file_ids'] = index_files(self.files)
+        app_data['archive_format'] = self.format_var.get()
         app_data['password_hash'] = generate_password_hash(
             password) if password else None
-        app_data['download_count'] = 0
         app_data['start_time'] = time.time()
-        app_data['unique_ips'].clear()
-        app_data['download_log'].clear()
-
-        # Find free port
-        self.port = self.find_free_port()
-
-        # Start Flask server
-        def run_flask():
-            try:
-                # CRITICAL: host='0.0.0.0' allows mobile devices on LAN to connect
-                app.run(
-                    host='0.0.0.0',
-                    port=self.port,
-                    debug=False,
-                    use_reloader=False,
-                    threaded=True
-                )
-            except Exception as e:
-                print(f"Flask error: {e}")
-
-        self.flask_thread = threading.Thread(target=run_flask, daemon=True)
-        self.flask_thread.start()
-        time.sleep(2)
+        # Worker processes need shared statistics; one process keeps them
+        # in memory
+        workers = self.workers_var.get() if PREFORK_OK else 1
+        app_data['state'] = open_state(workers)
+        # In internet mode connections still come from the ngrok agent on
+        # this machine, so they are tuned as LAN ones; the tunnel's slow
+        # link is the agent's own upstream connection
+        app_data['transport'] = TransportTuner('lan')
+
+        # Bind the port now and hand the socket to the server, so nothing
+        # can take it in between.  The last share's port comes first so
+        # its URL and QR code keep working.
+        try:
+            sock = self.share_server.acquire(
+                self.port or config.SHARE_PORT, config.SHARE_PORT_RANGE)
+        except OSError as e:
+            self.start_failed(e)
+            return
+        self.port = socket_port(sock)
+
+        # Start Flask server: forked worker processes for heavy load, or a
+        # threaded server in this process.  The rest of the start-up runs
+        # once it reports that it is accepting connections.
+        ready = self.share_server.start(sock, workers,
+                                        on_exit=app_data['state'].flush)
+
+        # Background work starts only now: worker processes forked while
+        # its threads run would inherit their locks held and their builds
+        # never finishing.  Workers see the ZIP once it is complete on disk.
+        if (len(self.files) > 1 and config.ARCHIVE_CACHE_ENABLED
+                and self.format_var.get() == 'zip'):
+            self.archive_build = archive_cache.prebuild(self.files)
+
+        if self.warm_cache_var.get():
+            self.cache_warmer = CacheWarmer(self.files).start()
+
+        ready.add_done_callback(
+            lambda f: self.root.after(0, self.server_ready, f, password))
+
+    def start_failed(self, error):
+        """Undo a share start that could not get its server running"""
+        app_data['state'].close()
+        app_data['state'] = LocalState()
+        if self.archive_build:
+            self.archive_build.cancel()
+            self.archive_build = None
+        if self.cache_warmer:
+            self.cache_warmer.cancel()
+            self.cache_warmer = None
+        messagebox.showerror("Error", f"❌ Could not start server: {error}")
+        self.status_label.config(text="❌ Failed to start", fg='red')
+        self.start_btn.config(state='normal')
+
+    def server_ready(self, ready, password):
+        """Finish starting the share once the server is up (or failed)"""
+        if ready.cancelled():
+            return
+        error = ready.exception()
+        if error:
+            self.share_server.stop()
+            self.start_failed(error)
+            return
 
         # Get local IP
         local_ip = self.get_local_ip()
@@ -1521,10 +2009,28 @@ class ShareFastGUI:
             # Clear app data
             app_data.update({
                 'files': [],
-                'password_hash': None,
-                'download_count': 0
+                'file_ids': {},
+                'password_hash': None
             })
 
+            # Release the port and drop clients still downloading the
+            # old share
+            self.share_server.stop()
+
+            # Keep the share's final download count in its history entry
+            state = app_data['state']
+            self.record_downloads(state.stats()['downloads'])
+            state.close()
+            app_data['state'] = LocalState()
+
+            # Stop any archive pre-build that is still running
+            if self.archive_build:
+                self.archive_build.cancel()
+                self.archive_build = None
+            if self.cache_warmer:
+                self.cache_warmer.cancel()
+                self.cache_warmer = None
+
             # Disconnect ngrok if active
             if self.ngrok_tunnel:
                 try:
@@ -1542,6 +2048,8 @@ class ShareFastGUI:
             self.qr_label.config(
                 image='', text="QR code will appear here", bg='#f0f0f0')
             self.timer_label.config(text="")
+            self.archive_label.config(text="")
+            self.warm_label.config(text="")
             self.status_label.config(text="⏹️ Stopped", fg='red')
             self.start_btn.config(state='normal')
             self.stop_btn.config(state='disabled')
@@ -1555,8 +2063,13 @@ class ShareFastGUI:
 
 def main():
     """Main entry point"""
+    parser = argparse.ArgumentParser(description=config.APP_NAME)
+    parser.add_argument('--workers', type=int, default=config.FLASK_WORKERS,
+                        help="server processes for shares (default: %(default)s)")
+    args = parser.parse_args()
+
     root = tk.Tk()
-    gui_app = ShareFastGUI(root)
+    gui_app = ShareFastGUI(root, workers=max(args.workers, 1))
 
     def on_closing():
         """Handle window close"""
@@ -1591,4 +2104,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Needed by the archive compression pool in frozen builds
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,171 @@
+"""
+Kernel readahead hints and page-cache warming for SecureShare Pro
+"""
+
+import os
+import threading
+
+import config
+
+FADVISE_OK = hasattr(os, 'posix_fadvise')
+
+# Active transfers per file identity, so DONTNEED never drops pages that
+# another download of the same file is still reading
+_active = {}
+_active_lock = threading.Lock()
+
+
+def fadvise(fd, offset, length, advice):
+    """``posix_fadvise`` where available; hints are best-effort"""
+    if not FADVISE_OK:
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass
+
+
+class SendHint:
+    """Readahead hints for one transfer of ``[start, stop)`` of a file.
+
+    On start the kernel is told the file will be read sequentially and to
+    begin reading the first window.  ``done`` drops a large file's pages
+    once it has been sent completely and nobody else is reading it, so one
+    big download does not evict the share's hotter files.
+    """
+
+    def __init__(self, f, start=0, stop=None):
+        self.fd = None
+        if not FADVISE_OK or not config.FADVISE_ENABLED:
+            return
+        try:
+            self.fd = os.dup(f.fileno())
+            st = os.fstat(self.fd)
+        except (AttributeError, OSError, ValueError):
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+            return
+        self.identity = (st.st_dev, st.st_ino)
+        self.size = st.st_size
+        self.start = start
+        self.stop = st.st_size if stop is None else stop
+        start, stop = self.start, self.stop
+        with _active_lock:
+            _active[self.identity] = _active.get(self.identity, 0) + 1
+
+        fadvise(self.fd, start, stop - start, os.POSIX_FADV_SEQUENTIAL)
+        fadvise(self.fd, start, min(config.FADVISE_WILLNEED_BYTES, stop - start),
+                os.POSIX_FADV_WILLNEED)
+
+    def done(self, complete=True):
+        if self.fd is None:
+            return
+        with _active_lock:
+            _active[self.identity] -= 1
+            last = _active[self.identity] == 0
+            if last:
+                del _active[self.identity]
+        if complete and last and self.size >= config.FADVISE_DONTNEED_MIN_SIZE:
+            fadvise(self.fd, self.start, self.stop - self.start, os.POSIX_FADV_DONTNEED)
+        os.close(self.fd)
+        self.fd = None
+
+
+def hinted(chunks, hint):
+    """Yield ``chunks``, finishing ``hint`` when the body is exhausted or closed"""
+    complete = False
+    try:
+        yield from chunks
+        complete = True
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+        hint.done(complete)
+
+
+def memory_available():
+    """Bytes the kernel reports as available, or None if unknown"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class CacheWarmer:
+    """Read shared files into the page cache ahead of the first download.
+
+    Files are warmed in selection order until ``budget`` bytes are read;
+    the budget is further capped to half of the memory currently available
+    so warming never pushes the machine into swap.
+    """
+
+    def __init__(self, files, budget=None):
+        self.files = list(files)
+        budget = budget or config.WARM_CACHE_BUDGET
+        available = memory_available()
+        if available is not None:
+            budget = min(budget, available // 2)
+        self.budget = budget
+        self.target = 0
+        self.warmed = 0
+        self.done = False
+        self.cancelled = False
+
+    @property
+    def progress(self):
+        """Fraction of the warming target read so far (0.0 - 1.0)"""
+        if self.done:
+            return 1.0
+        if not self.target:
+            return 0.0
+        return min(self.warmed / self.target, 1.0)
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        plan = []
+        remaining = self.budget
+        for file_path in self.files:
+            try:
+                size = os.path.getsize(file_path)
+            except OSError:
+                continue
+            if remaining <= 0:
+                break
+            length = min(size, remaining)
+            plan.append((file_path, length))
+            remaining -= length
+        self.target = sum(length for _, length in plan)
+
+        buf = bytearray(config.ARCHIVE_CHUNK_SIZE)
+        try:
+            for file_path, length in plan:
+                try:
+                    with open(file_path, 'rb', buffering=0) as f:
+                        if FADVISE_OK:
+                            # Let the kernel read ahead while we walk the file
+                            fadvise(f.fileno(), 0, length, os.POSIX_FADV_WILLNEED)
+                        left = length
+                        while left > 0 and not self.cancelled:
+                            n = f.readinto(memoryview(buf)[:min(len(buf), left)])
+                            if not n:
+                                break
+                            left -= n
+                            self.warmed += n
+                except OSError:
+                    continue
+                if self.cancelled:
+                    return
+        finally:
+            self.done = True
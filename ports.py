@@ -0,0 +1,51 @@
+"""
+Listening-port acquisition for SecureShare Pro's servers
+"""
+
+import os
+import socket
+
+import config
+
+
+def bind_socket(host, port):
+    """A listening TCP socket bound to ``(host, port)``.
+
+    The port is never shared (no ``SO_REUSEPORT``): binding fails while
+    anything else listens on it.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        # On Windows SO_REUSEADDR would let us bind a port another program
+        # is listening on; elsewhere it only skips TIME_WAIT leftovers
+        if os.name != 'nt':
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(config.SERVER_BACKLOG)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def acquire_socket(preferred=None, port_range=None, host=''):
+    """Bind the first free port of ``preferred``, then ``port_range``, then
+    one the OS picks, and return the socket.
+
+    The server is handed this socket rather than the port number, so no
+    other share or program can take the port between the choice and the
+    server starting.
+    """
+    candidates = [preferred] if preferred else []
+    candidates.extend(port for port in port_range or () if port != preferred)
+    candidates.append(0)
+    for port in candidates:
+        try:
+            return bind_socket(host, port)
+        except OSError as e:
+            error = e
+    raise error
+
+
+def socket_port(sock):
+    return sock.getsockname()[1]
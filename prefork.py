@@ -0,0 +1,169 @@
+"""
+Multi-process serving for SecureShare Pro's Flask app
+"""
+
+import atexit
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+import config
+from ports import bind_socket
+
+PREFORK_OK = hasattr(os, 'fork')
+
+# A worker that dies sooner than this after starting is restarted only
+# after a pause, so a crash loop does not spin the CPU
+MIN_WORKER_UPTIME = 1.0
+
+# Seconds to wait for the first worker to listen before start is reported
+# as failed
+READY_TIMEOUT = 10
+
+
+def log(message):
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    print(f"[{timestamp}] {message}")
+
+
+def exit_worker(signum, frame):
+    sys.exit(0)
+
+
+def serve_worker(app, host, port, request_handler, sock, on_exit, listening):
+    """Entry point of one worker process"""
+    # The parent's Ctrl+C handling is not ours; stop() sends SIGTERM, which
+    # unwinds serve_forever so on_exit still runs
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, exit_worker)
+    from werkzeug.serving import make_server
+
+    server = make_server(host, port, app, threaded=True,
+                         request_handler=request_handler, fd=sock.fileno())
+    listening.set()
+    try:
+        server.serve_forever()
+    finally:
+        if on_exit:
+            on_exit()
+
+
+class PreforkServer:
+    """Serve a WSGI app from several forked worker processes.
+
+    Every worker accepts from the one listening socket the parent binds,
+    which keeps the port exclusive to this server: with ``SO_REUSEPORT``
+    another share could bind the same port and take part of its traffic.
+    The parent only supervises: workers that exit are restarted until
+    ``stop`` is called.  Each worker keeps its own copy of the app's
+    module state from the moment it was forked, so anything the parent
+    must see goes through shared storage; ``on_exit`` runs in a worker as
+    it stops, to write out what it still holds.
+
+    ``ready`` is a future that resolves to the port once the first worker
+    is accepting connections, or fails if none manages to.
+
+    ``sock`` is an already listening socket to serve on instead of binding
+    ``port`` (see ``ShareServer.acquire``).
+    """
+
+    def __init__(self, app, host, port, workers=None, request_handler=None,
+                 on_exit=None, sock=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers or config.FLASK_WORKERS
+        self.request_handler = request_handler
+        self.on_exit = on_exit
+        self.context = multiprocessing.get_context('fork')
+        self.processes = []
+        self.restarts = 0
+        self.socket = sock
+        self.stopping = threading.Event()
+        self.supervisor = None
+        self.lock = threading.Lock()
+        self.listening = self.context.Event()
+        self.ready = Future()
+
+    def start(self):
+        """Bind the port and start the workers; raises OSError if it is taken"""
+        if self.socket is None:
+            self.socket = bind_socket(self.host, self.port)
+        self.processes = [self.spawn() for _ in range(self.workers)]
+        self.supervisor = threading.Thread(target=self.supervise, daemon=True)
+        self.supervisor.start()
+        # multiprocessing joins non-daemonic children at exit; stop them
+        # first so exiting without stop() does not hang
+        atexit.register(self.stop)
+        log(f"Serving on port {self.port} with {self.workers} worker processes")
+
+    def spawn(self):
+        process = self.context.Process(
+            target=serve_worker,
+            args=(self.app, self.host, self.port, self.request_handler,
+                  self.socket, self.on_exit, self.listening),
+            # Not daemonic: daemonic processes may not start children, and
+            # workers need the archive compression pool.  stop() ends them.
+            daemon=False)
+        process.start()
+        process.started_at = time.monotonic()
+        return process
+
+    def supervise(self):
+        """Report readiness, then restart workers that exit until the
+        server is stopped"""
+        deadline = time.monotonic() + READY_TIMEOUT
+        while not self.listening.wait(0.01):
+            if self.stopping.is_set():
+                self.ready.cancel()
+                return
+            if time.monotonic() > deadline:
+                self.ready.set_exception(TimeoutError(
+                    f"no worker process started listening on port {self.port}"))
+                break
+        else:
+            self.ready.set_result(self.port)
+        while not self.stopping.wait(0.5):
+            for i, process in enumerate(self.processes):
+                if process.is_alive():
+                    continue
+                uptime = time.monotonic() - process.started_at
+                log(f"Worker {process.pid} exited with code {process.exitcode}, restarting")
+                if uptime < MIN_WORKER_UPTIME and self.stopping.wait(MIN_WORKER_UPTIME):
+                    return
+                with self.lock:
+                    if self.stopping.is_set():
+                        return
+                    self.processes[i] = self.spawn()
+                    self.restarts += 1
+
+    def stop(self, timeout=5):
+        """Stop the workers (SIGTERM, then SIGKILL) and release the port"""
+        atexit.unregister(self.stop)
+        with self.lock:
+            self.stopping.set()
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.kill()
+                process.join()
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'alive': sum(1 for p in self.processes if p.is_alive()),
+                'restarts': self.restarts,
+            }
@@ -0,0 +1,332 @@
+"""
+Slow-client and idle-connection reaping for SecureShare Pro's servers
+"""
+
+import collections
+import io
+import os
+import select
+import socket
+import threading
+import time
+from datetime import datetime
+
+import config
+
+POLL_OK = hasattr(select, 'poll')
+
+# Smallest send handed over in one piece when sizing sends to a client's rate
+MIN_CHUNK_SIZE = 64 * 1024
+
+# Reasons a connection is dropped.  Idle keep-alive closes are routine, so
+# they are counted but not logged.
+REASONS = {
+    'idle': "idle keep-alive connection",
+    'header': "request headers not received in time",
+    'read': "request body read timed out",
+    'write': "client stopped reading the response",
+    'slow': "client below the minimum transfer rate",
+}
+
+
+class Reaper:
+    """Counts and logs connections dropped for breaking a time limit"""
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.lock = threading.Lock()
+
+    def reap(self, peer, reason):
+        with self.lock:
+            self.counts[reason] += 1
+        if reason != 'idle':
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            print(f"[{timestamp}] Dropped {peer}: {REASONS[reason]}")
+
+    def stats(self):
+        with self.lock:
+            return {
+                'reaped': dict(self.counts),
+                'limits': {
+                    'idle_timeout': config.KEEPALIVE_TIMEOUT,
+                    'header_timeout': config.HEADER_TIMEOUT,
+                    'read_timeout': config.READ_TIMEOUT,
+                    'write_timeout': config.WRITE_TIMEOUT,
+                    'min_send_rate': config.MIN_SEND_RATE,
+                    'slow_client_period': config.SLOW_CLIENT_PERIOD,
+                },
+            }
+
+
+class SendFloor:
+    """Minimum transfer rate of one response, kept as a deadline.
+
+    The deadline starts ``SLOW_CLIENT_PERIOD`` seconds out and every byte
+    the client accepts pushes it back by ``1 / MIN_SEND_RATE`` seconds, up
+    to one period ahead.  A client averaging less than the floor for about
+    a period runs out of time.  Time the server spends between writes
+    (disk reads, compression) is not held against the client.
+    """
+
+    def __init__(self):
+        self.rate = config.MIN_SEND_RATE
+        self.period = config.SLOW_CLIENT_PERIOD
+        self.deadline = None
+        self.paused_at = None
+        self.started = None
+        self.estimate = None
+
+    def begin(self):
+        now = time.monotonic()
+        if self.deadline is None:
+            self.deadline = now + self.period
+        elif self.paused_at is not None:
+            self.deadline += now - self.paused_at
+        self.paused_at = None
+        self.started = now
+
+    def end(self):
+        self.paused_at = time.monotonic()
+
+    def sent(self, n):
+        now = time.monotonic()
+        if n >= MIN_CHUNK_SIZE and now > self.started:
+            self.estimate = n / (now - self.started)
+        self.started = now
+        if self.rate and self.deadline is not None:
+            self.deadline = min(self.deadline + n / self.rate, now + self.period)
+
+    def chunk_size(self, maximum):
+        """Bytes to hand over in one send whose progress is not visible
+        (a drain or sendfile call), so the floor is still judged promptly:
+        about a quarter period's worth at the client's recent rate"""
+        if not self.rate:
+            return maximum
+        if self.estimate is None:
+            return min(MIN_CHUNK_SIZE, maximum)
+        return int(min(max(self.estimate * self.period / 4, MIN_CHUNK_SIZE), maximum))
+
+    def remaining(self, pending=0):
+        """Seconds left before the floor is broken, counting ``pending``
+        bytes the client would be credited for; None without a floor"""
+        if not self.rate or self.deadline is None:
+            return None
+        return self.deadline + pending / self.rate - time.monotonic()
+
+
+class ConnectionGuard:
+    """Time limits for one blocking client socket.
+
+    Waiting for a request is bounded by the keep-alive timeout, and once
+    its first byte arrives the request line and headers must be complete
+    within ``HEADER_TIMEOUT``, so slowloris clients cannot hold a worker by
+    trickling headers.  Body reads wait at most ``READ_TIMEOUT``.  Sends
+    give up after ``WRITE_TIMEOUT`` without progress or when the client
+    falls below the ``SendFloor``.  Every drop is reported to ``reaper``.
+
+    The socket is switched to non-blocking mode; each call tries the
+    operation first and only polls when it would block.
+    """
+
+    def __init__(self, sock, peer, reaper):
+        self.sock = sock
+        self.peer = peer
+        self.reaper = reaper
+        self.read_deadline = None
+        self.read_reason = 'read'
+        self.awaiting_request = False
+        self.reaped = None
+        self.floor = SendFloor()
+        self.poller = None
+        sock.setblocking(False)
+
+    def expect_request(self):
+        """The connection is idle until the next request starts arriving"""
+        self.read_deadline = time.monotonic() + config.KEEPALIVE_TIMEOUT
+        self.read_reason = 'idle'
+        self.awaiting_request = True
+        self.floor = SendFloor()
+
+    def headers_done(self):
+        self.read_deadline = None
+        self.read_reason = 'read'
+        self.awaiting_request = False
+
+    def timed_out(self, reason):
+        self.reaped = reason
+        self.reaper.reap(self.peer, reason)
+        return TimeoutError(REASONS[reason])
+
+    def recv_into(self, buffer):
+        started = time.monotonic()
+        while True:
+            try:
+                n = self.sock.recv_into(buffer)
+                break
+            except BlockingIOError:
+                pass
+            if self.read_deadline is None:
+                timeout = started + config.READ_TIMEOUT - time.monotonic()
+            else:
+                timeout = self.read_deadline - time.monotonic()
+            if timeout <= 0 or not self.wait(False, timeout):
+                raise self.timed_out(self.read_reason)
+        if n and self.awaiting_request:
+            self.awaiting_request = False
+            self.read_deadline = time.monotonic() + config.HEADER_TIMEOUT
+            self.read_reason = 'header'
+        return n
+
+    def send_timeout(self, stalled_since):
+        timeout = stalled_since + config.WRITE_TIMEOUT - time.monotonic()
+        reason = 'write'
+        remaining = self.floor.remaining()
+        if remaining is not None and remaining < timeout:
+            timeout, reason = remaining, 'slow'
+        return timeout, reason
+
+    def send(self, func):
+        """Call ``func`` (one non-blocking send) until it makes progress"""
+        stalled_since = time.monotonic()
+        while True:
+            try:
+                sent = func()
+            except BlockingIOError:
+                sent = None
+            if sent is not None:
+                self.floor.sent(sent)
+                return sent
+            timeout, reason = self.send_timeout(stalled_since)
+            if timeout <= 0 or not self.wait(True, timeout):
+                raise self.timed_out(reason)
+
+    def sendall(self, data):
+        """``socket.sendall`` with the send limits applied to every partial send"""
+        view = memoryview(data).cast('B')
+        self.floor.begin()
+        try:
+            while view:
+                sent = self.send(lambda: self.sock.send(view))
+                view = view[sent:]
+        finally:
+            self.floor.end()
+
+    def sendfile(self, f, offset, count):
+        """Send up to ``count`` bytes of ``f`` with ``os.sendfile``.
+
+        Returns the bytes sent by one partial send, so callers can track
+        progress.
+        """
+        self.floor.begin()
+        try:
+            return self.send(
+                lambda: os.sendfile(self.sock.fileno(), f.fileno(), offset, count))
+        finally:
+            self.floor.end()
+
+    def wait(self, writable, timeout):
+        """Wait until the socket is readable (or writable); False on timeout"""
+        if not POLL_OK:
+            if writable:
+                return bool(select.select([], [self.sock], [], timeout)[1])
+            return bool(select.select([self.sock], [], [], timeout)[0])
+        event = select.POLLOUT if writable else select.POLLIN
+        if self.poller is None:
+            self.poller = select.poll()
+            self.poller.register(self.sock, event)
+        else:
+            self.poller.modify(self.sock, event)
+        return bool(self.poller.poll(timeout * 1000))
+
+
+class GuardedReader(io.RawIOBase):
+    """Raw reader for ``rfile`` that applies the guard's read deadlines"""
+
+    def __init__(self, guard):
+        super().__init__()
+        self.guard = guard
+        self.nowait = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.nowait:
+            try:
+                return self.guard.sock.recv_into(buffer)
+            except BlockingIOError:
+                return None
+        return self.guard.recv_into(buffer)
+
+
+class GuardedWriter(io.BufferedIOBase):
+    """Unbuffered ``wfile`` that applies the guard's send limits"""
+
+    def __init__(self, guard):
+        super().__init__()
+        self.guard = guard
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.guard.sendall(data)
+        with memoryview(data) as view:
+            return view.nbytes
+
+    def fileno(self):
+        return self.guard.sock.fileno()
+
+
+class ReapingRequestHandler:
+    """Mixin for ``BaseHTTPRequestHandler`` subclasses enforcing the limits.
+
+    ``rfile`` and ``wfile`` are replaced by guarded versions and the guard
+    is available as ``self.guard`` (its ``sendfile`` for zero-copy bodies).
+    Timeouts close the connection without a log line of their own.
+    Subclasses provide the ``Reaper`` as ``self.reaper``.
+    """
+
+    def setup(self):
+        super().setup()
+        self.guard = None
+        if type(self.connection) is not socket.socket:
+            # TLS and other wrapped sockets keep their plain timeout
+            return
+        self.guard = ConnectionGuard(self.connection, self.client_address[0], self.reaper)
+        # The makefile() reader holds a reference that would keep the
+        # socket open after the server closes it
+        self.rfile.close()
+        self.reader = GuardedReader(self.guard)
+        self.rfile = io.BufferedReader(self.reader)
+        self.wfile = GuardedWriter(self.guard)
+
+    def handle_one_request(self):
+        if self.guard:
+            self.guard.expect_request()
+        try:
+            super().handle_one_request()
+        except TimeoutError:
+            # Already reported by the reaper
+            self.close_connection = True
+
+    def log_error(self, format, *args):
+        # The stdlib logs "Request timed out" for every timeout it catches;
+        # the reaper's line is the only one a dropped connection gets
+        if self.guard and self.guard.reaped:
+            return
+        super().log_error(format, *args)
+
+    def input_pending(self):
+        """Whether more input has already arrived, read without waiting"""
+        self.reader.nowait = True
+        try:
+            return bool(self.rfile.peek(1))
+        finally:
+            self.reader.nowait = False
+
+    def parse_request(self):
+        ok = super().parse_request()
+        if self.guard:
+            self.guard.headers_done()
+        return ok
@@ -2,13 +2,41 @@
 HTTP Server implementation with bandwidth monitoring
 """
 
+import collections
+import functools
+import io
 import os
+import selectors
+import socket
 import socketserver
 import http.server
+from http import HTTPStatus
 from pathlib import Path
 from datetime import datetime
 import threading
 import time
+import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import config
+import http_utils
+import pagecache
+from async_server import AsyncHTTPServer
+from blockcache import BlockCache, CachedFile
+from encoded_cache import EncodedCache, available_encodings
+from listing import ListingCache, ListingPage
+from ports import socket_port
+from reaper import Reaper, ReapingRequestHandler
+from transport import TransportTuner
+
+# Read size when copying response bodies
+COPY_CHUNK_SIZE = 64 * 1024
+
+# Sidecars and snapshots are keyed by absolute path and blocks by file
+# identity, so every share can use the same caches
+shared_encoded_cache = EncodedCache()
+listing_cache = ListingCache()
+shared_block_cache = BlockCache()
 
 
 class BandwidthTracker:
@@ -48,22 +76,92 @@ class BandwidthTracker:
             self.start_time = time.time()
 
 
-class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+class CustomHTTPRequestHandler(ReapingRequestHandler, http.server.SimpleHTTPRequestHandler):
     """Custom HTTP handler with bandwidth tracking and logging"""
 
-    bandwidth_tracker = BandwidthTracker()
-    share_path = None
-    password = None
-    activity_callback = None
+    # Persistent connections: every response carries Content-Length or is
+    # chunked, idle connections time out and each serves a bounded number
+    protocol_version = "HTTP/1.1"
+    timeout = config.KEEPALIVE_TIMEOUT
+
+    @property
+    def reaper(self):
+        return self.server.reaper
+
+    def setup(self):
+        """Pick up the share's state from the server that accepted us"""
+        super().setup()
+        self.password = self.server.password
+        self.activity_callback = self.server.activity_callback
+        self.bandwidth_tracker = self.server.tracker
+        self.encoded_cache = self.server.encoded_cache
+        self.block_cache = self.server.block_cache
+
+    def handle(self):
+        """Serve requests on this connection until it goes idle, closes or
+        hits the cap.
+
+        A connection with no next request pending is left open in the
+        server's ``parking`` for its idle watcher, so it holds no worker
+        between requests.
+        """
+        self.requests_handled = self.server.parking.pop(self.connection, 0)
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if self.guard and not self.input_pending():
+                self.server.parking[self.connection] = self.requests_handled
+                return
+            self.handle_one_request()
+
+    def handle_one_request(self):
+        self.requests_handled += 1
+        try:
+            super().handle_one_request()
+        except ConnectionError:
+            # Client went away between requests
+            self.close_connection = True
+            return
+        finally:
+            # Flush whatever the cork set in end_headers still holds back
+            self.server.transport.cork(self.connection, False)
+        if self.requests_handled >= config.KEEPALIVE_MAX_REQUESTS:
+            self.close_connection = True
+
+    def send_error(self, code, message=None, explain=None):
+        """Send an error page, keeping the connection for file-level errors.
+
+        The stdlib always closes after an error, which is only needed when
+        the request itself could not be parsed.
+        """
+        self.keep_alive_error = code in (HTTPStatus.NOT_FOUND, HTTPStatus.FORBIDDEN)
+        try:
+            super().send_error(code, message, explain)
+        finally:
+            self.keep_alive_error = False
+
+    def send_header(self, keyword, value):
+        if (getattr(self, 'keep_alive_error', False)
+                and keyword.lower() == 'connection' and value.lower() == 'close'):
+            return
+        super().send_header(keyword, value)
+
+    def end_headers(self):
+        """Announce whether the connection stays open after this response"""
+        if not self.close_connection:
+            # Request bodies are never read, so they would corrupt the stream
+            has_body = self.headers.get('Content-Length', '0').strip() not in ('', '0')
+            if has_body or self.requests_handled >= config.KEEPALIVE_MAX_REQUESTS:
+                self.send_header("Connection", "close")
+            elif self.request_version == 'HTTP/1.0':
+                self.send_header("Connection", "keep-alive")
+        self.server.transport.cork(self.connection)
+        super().end_headers()
 
     def do_GET(self):
         """Handle GET requests with bandwidth tracking"""
-        # Password protection
-        if self.password:
-            auth = self.headers.get('Authorization')
-            if not auth or not self.check_auth(auth):
-                self.send_auth_required()
-                return
+        if not self.authorize():
+            return
 
         # Track activity
         if self.activity_callback:
@@ -71,36 +169,281 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
 
         # Serve file and track bandwidth
         try:
-            # Call parent's do_GET
             f = self.send_head()
             if f:
                 try:
-                    self.copyfile(f, self.wfile)
+                    self.send_body(f)
                 finally:
                     f.close()
         except Exception as e:
+            # The response may be cut short, so the connection can't be reused
+            self.close_connection = True
             print(f"Error in GET: {e}")
 
+    def do_HEAD(self):
+        """Handle HEAD requests; plain files are only stat'ed, never opened"""
+        if not self.authorize():
+            return
+
+        f = self.send_head()
+        if f:
+            f.close()
+
+    def authorize(self):
+        """Check the password, sending a 401 challenge if it is missing"""
+        if self.password:
+            auth = self.headers.get('Authorization')
+            if not auth or not self.check_auth(auth):
+                self.send_auth_required()
+                return False
+        return True
+
+    def send_head(self):
+        """Send response headers, with Range and If-Range support for files.
+
+        Directories are left to SimpleHTTPRequestHandler.  Compressible
+        files are sent with a negotiated Content-Encoding.  Returns the open
+        file (or compressed stream) for GET requests, or None when there is
+        no body to send.
+        """
+        self.byte_ranges = None
+        self.multipart = None
+        self.streaming = False
+        self.chunked = False
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) or path.endswith('/'):
+            return super().send_head()
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+
+        ctype = self.guess_type(path)
+        compressible = self.encoded_cache.should_encode(path, st)
+        encoding = None
+        if compressible:
+            encoding = http_utils.negotiate_encoding(
+                self.headers.get('Accept-Encoding'), available_encodings())
+
+        # The representation actually sent: the file, or a compressed variant
+        body_path, body_st = path, st
+        if encoding:
+            sidecar = self.encoded_cache.lookup(path, st, encoding)
+            if sidecar:
+                body_path, body_st = sidecar, sidecar.stat()
+            elif 'Range' in self.headers:
+                # Ranges of a variant are only served from a finished sidecar
+                encoding = None
+        length = body_st.st_size
+        etag = http_utils.file_etag(st, encoding)
+
+        if http_utils.not_modified(self.headers.get('If-None-Match'),
+                                   self.headers.get('If-Modified-Since'),
+                                   etag, st.st_mtime):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_validators(st, etag, compressible)
+            self.end_headers()
+            return None
+
+        if encoding and body_path == path:
+            self.streaming = True
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-type", ctype)
+            self.send_header("Content-Encoding", encoding)
+            self.send_validators(st, etag, compressible)
+            # The compressed length is unknown up front
+            if self.request_version == 'HTTP/1.1':
+                self.chunked = True
+                self.send_header("Transfer-Encoding", "chunked")
+            else:
+                self.send_header("Connection", "close")
+            self.end_headers()
+            if self.command == 'HEAD':
+                return None
+            return self.encoded_cache.stream(path, st, encoding)
+
+        ranges = None
+        if http_utils.if_range_matches(self.headers.get('If-Range'), etag, st.st_mtime):
+            try:
+                ranges = http_utils.parse_range_header(
+                    self.headers.get('Range'), length)
+            except http_utils.RangeNotSatisfiable:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", f"bytes */{length}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+
+        f = None
+        if self.command != 'HEAD':
+            try:
+                f = self.block_cache.open(body_path, body_st)
+            except OSError:
+                self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+                return None
+
+        if ranges is None:
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-type", ctype)
+            self.send_header("Content-Length", str(length))
+        elif len(ranges) == 1:
+            start, stop = ranges[0]
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header("Content-type", ctype)
+            self.send_header("Content-Range",
+                             http_utils.content_range(start, stop, length))
+            self.send_header("Content-Length", str(stop - start))
+        else:
+            self.multipart = http_utils.MultipartRanges(ranges, length, ctype)
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header("Content-type", self.multipart.content_type)
+            self.send_header("Content-Length", str(self.multipart.content_length))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_validators(st, etag, compressible)
+        self.end_headers()
+        self.byte_ranges = ranges
+        return f
+
+    def list_directory(self, path):
+        """Send one page of the cached listing of ``path``, streamed.
+
+        Replaces http.server's version, which lists, sorts and renders the
+        whole directory on every request.
+        """
+        try:
+            snapshot = listing_cache.get(path)
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "No permission to list directory")
+            return None
+
+        url = urllib.parse.urlsplit(self.path)
+        page = ListingPage(snapshot, url.path, url.query)
+        self.streaming = True
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-type", page.content_type)
+        self.send_header("Cache-Control", "no-cache")
+        if self.request_version == 'HTTP/1.1':
+            self.chunked = True
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        return iter(page)
+
+    def send_validators(self, st, etag, compressible=False):
+        """Send ETag, Last-Modified, Cache-Control and Vary for a file"""
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", http_utils.http_date(st.st_mtime))
+        self.send_header("Cache-Control",
+                         http_utils.cache_control(private=bool(self.password)))
+        if compressible:
+            self.send_header("Vary", "Accept-Encoding")
+
+    def send_body(self, f):
+        """Write the body selected by send_head: whole file, range or multipart"""
+        if self.streaming:
+            for data in f:
+                if not data:
+                    continue
+                if self.chunked:
+                    self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+                else:
+                    self.wfile.write(data)
+                self.bandwidth_tracker.add_download(len(data))
+            if self.chunked:
+                self.wfile.write(b'0\r\n\r\n')
+            return
+
+        if self.multipart:
+            spans = [(start, stop) for header, start, stop in self.multipart]
+            hint = pagecache.SendHint(f, min(spans)[0], max(stop for _, stop in spans))
+        elif self.byte_ranges:
+            hint = pagecache.SendHint(f, *self.byte_ranges[0])
+        else:
+            hint = pagecache.SendHint(f)
+        complete = False
+        try:
+            if self.multipart:
+                for header, start, stop in self.multipart:
+                    self.wfile.write(header)
+                    self.copy_range(f, start, stop)
+                self.wfile.write(self.multipart.trailer)
+            elif self.byte_ranges:
+                start, stop = self.byte_ranges[0]
+                self.copy_range(f, start, stop)
+            else:
+                self.copy_range(f, 0, None)
+            complete = True
+        finally:
+            hint.done(complete)
+
+    def copy_range(self, f, start, stop):
+        """Copy ``[start, stop)`` of ``f`` to the client (``stop=None``: to EOF)"""
+        if isinstance(f, CachedFile):
+            for data in f.iter_range(start, stop):
+                self.wfile.write(data)
+                self.bandwidth_tracker.add_download(len(data))
+            return
+
+        fileno = self.sendfile_fileno(f)
+        if fileno is not None:
+            if stop is None:
+                stop = os.fstat(fileno).st_size
+            self.sendfile_range(f, start, stop)
+            return
+
+        if stop is None:
+            chunks = iter(lambda: f.read(COPY_CHUNK_SIZE), b'')
+        else:
+            chunks = http_utils.read_range(f, start, stop, COPY_CHUNK_SIZE)
+        for data in chunks:
+            self.wfile.write(data)
+            self.bandwidth_tracker.add_download(len(data))
+
+    def sendfile_fileno(self, f):
+        """File descriptor to sendfile from, or None to copy through Python.
+
+        Only real files on a plain TCP socket qualify; in-memory listings,
+        TLS and other wrapped connections use the read/write loop.
+        """
+        if not config.USE_SENDFILE or not hasattr(os, 'sendfile'):
+            return None
+        if self.guard is None:  # Not a plain socket
+            return None
+        try:
+            return f.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return None
+
+    def sendfile_range(self, f, start, stop):
+        """Send ``[start, stop)`` of ``f`` without copying it into userspace"""
+        offset = start
+        while offset < stop:
+            sent = self.guard.sendfile(
+                f, offset, min(config.SENDFILE_BLOCK_SIZE, stop - offset))
+            if not sent:
+                break
+            offset += sent
+            self.bandwidth_tracker.add_download(sent)
+
     def check_auth(self, auth_header):
         """Check password authorization"""
-        import base64
-        try:
-            auth_type, auth_string = auth_header.split(' ', 1)
-            if auth_type.lower() == 'basic':
-                decoded = base64.b64decode(auth_string).decode('utf-8')
-                username, password = decoded.split(':', 1)
-                return password == self.password
-        except Exception:
-            pass
-        return False
+        return http_utils.check_basic_auth(auth_header, self.password)
 
     def send_auth_required(self):
         """Send 401 authentication required"""
+        body = b'Authentication required'
         self.send_response(401)
         self.send_header('WWW-Authenticate', 'Basic realm="SecureShare"')
         self.send_header('Content-type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(b'Authentication required')
+        if self.command != 'HEAD':
+            self.wfile.write(body)
 
     def log_message(self, format, *args):
         """Custom logging"""
@@ -108,40 +451,307 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         print(f"[{timestamp}] {format % args}")
 
 
+class PooledHTTPServer(socketserver.TCPServer):
+    """TCP server that handles connections on a bounded worker pool.
+
+    A worker only holds a connection while a request is being read or
+    answered.  ``serve_forever`` is one selector loop over the listening
+    socket and the idle connections: new connections and keep-alive
+    connections between requests are handed to a worker once the next
+    request starts arriving, and closed after ``KEEPALIVE_TIMEOUT`` (or,
+    beyond ``SERVER_MAX_IDLE``, oldest first).  When every worker is busy,
+    readable connections wait for one, for at most ``HEADER_TIMEOUT``.
+    While as many wait as there are workers the loop stops accepting, so
+    new clients wait in the listen backlog.
+    The share's password, callback and tracker live here rather than on
+    the handler class, so several servers can run in one process.  ``sock``
+    is an already listening socket to serve on instead of binding
+    ``server_address``.
+    """
+
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, workers=None, backlog=None,
+                 password=None, activity_callback=None, tracker=None,
+                 encoded_cache=None, transport=None, block_cache=None, reaper=None,
+                 sock=None, max_idle=None):
+        self.password = password
+        self.activity_callback = activity_callback
+        self.tracker = tracker or BandwidthTracker()
+        self.encoded_cache = encoded_cache or shared_encoded_cache
+        self.block_cache = block_cache or shared_block_cache
+        self.transport = transport or TransportTuner()
+        self.reaper = reaper or Reaper()
+        self.workers = workers or config.SERVER_WORKERS
+        self.max_idle = max_idle or config.SERVER_MAX_IDLE
+        self.request_queue_size = backlog or config.SERVER_BACKLOG
+        self.pool = ThreadPoolExecutor(max_workers=self.workers,
+                                       thread_name_prefix='FileServer')
+        self.slots = threading.BoundedSemaphore(self.workers)
+        self.closing = False
+        self.stopped = threading.Event()
+        self.stopped.set()
+
+        # Idle connections: socket -> (client address, requests served,
+        # idle since).  Only the serving loop touches the selector;
+        # workers queue connections in ``returned`` and wake it.
+        self.idle = collections.OrderedDict()
+        self.returned = collections.deque()
+        # Readable connections waiting for a free worker, oldest first:
+        # (socket, client address, requests served, readable since)
+        self.waiting = collections.deque()
+        self.accepting = False
+        # Set by a handler that leaves its connection open: requests served
+        self.parking = {}
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        self.wakeup_r.setblocking(False)
+        self.wakeup_w.setblocking(False)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ)
+
+        super().__init__(server_address, handler_class, bind_and_activate=sock is None)
+        if sock is not None:
+            self.socket.close()
+            self.socket = sock
+            self.server_address = sock.getsockname()
+
+    def serve_forever(self, poll_interval=None):
+        """Accept and dispatch connections until ``shutdown``"""
+        self.stopped.clear()
+        self.socket.setblocking(False)
+        try:
+            while not self.closing:
+                self.set_accepting(len(self.waiting) < self.workers)
+                deadlines = []
+                if self.idle:
+                    deadlines.append(next(iter(self.idle.values()))[2] + config.KEEPALIVE_TIMEOUT)
+                if self.waiting:
+                    deadlines.append(self.waiting[0][3] + config.HEADER_TIMEOUT)
+                timeout = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+                acceptable = False
+                for key, _ in self.selector.select(timeout):
+                    if key.fileobj is self.wakeup_r:
+                        try:
+                            while self.wakeup_r.recv(4096):
+                                pass
+                        except OSError:
+                            pass
+                    elif key.fileobj is self.socket:
+                        acceptable = True
+                    else:
+                        request = key.fileobj
+                        self.selector.unregister(request)
+                        client_address, requests, _ = self.idle.pop(request)
+                        self.waiting.append(
+                            (request, client_address, requests, time.monotonic()))
+                while self.returned:
+                    self.park(*self.returned.popleft())
+                self.dispatch_waiting()
+                if acceptable:
+                    self.accept_connections()
+                self.expire_idle()
+                self.expire_waiting()
+        finally:
+            self.set_accepting(False)
+            self.close_idle()
+            self.stopped.set()
+
+    def set_accepting(self, accepting):
+        """Watch the listening socket, or leave connections in the backlog"""
+        if accepting == self.accepting:
+            return
+        if accepting:
+            self.selector.register(self.socket, selectors.EVENT_READ)
+        else:
+            self.selector.unregister(self.socket)
+        self.accepting = accepting
+
+    def accept_connections(self):
+        """Accept as many connections as may still wait for a worker"""
+        for _ in range(self.workers - len(self.waiting)):
+            try:
+                request, client_address = self.get_request()
+            except OSError:
+                # Backlog empty (BlockingIOError) or the client gave up
+                return
+            if self.verify_request(request, client_address):
+                self.process_request(request, client_address)
+            else:
+                self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        """Park a new connection until its first request arrives"""
+        self.transport.tune(request)
+        self.park(request, client_address, 0)
+
+    def park(self, request, client_address, requests):
+        try:
+            self.selector.register(request, selectors.EVENT_READ)
+        except (ValueError, OSError):
+            # Closed meanwhile
+            self.shutdown_request(request)
+            return
+        self.idle[request] = (client_address, requests, time.monotonic())
+
+    def return_idle(self, request, client_address, requests):
+        self.returned.append((request, client_address, requests))
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wakeup_w.send(b'\0')
+        except OSError:
+            # A wake-up is already pending (buffer full) or the server closed
+            pass
+
+    def expire_idle(self):
+        now = time.monotonic()
+        while self.idle:
+            request, (client_address, _, since) = next(iter(self.idle.items()))
+            if len(self.idle) <= self.max_idle and now - since < config.KEEPALIVE_TIMEOUT:
+                break
+            self.drop_idle(request)
+            self.reaper.reap(client_address[0], 'idle')
+
+    def expire_waiting(self):
+        """Drop connections whose request has waited ``HEADER_TIMEOUT`` for
+        a worker without being read"""
+        now = time.monotonic()
+        while self.waiting and now - self.waiting[0][3] >= config.HEADER_TIMEOUT:
+            request, client_address, _, _ = self.waiting.popleft()
+            self.shutdown_request(request)
+            self.reaper.reap(client_address[0], 'header')
+
+    def drop_idle(self, request):
+        self.idle.pop(request, None)
+        try:
+            self.selector.unregister(request)
+        except (KeyError, ValueError):
+            pass
+        self.shutdown_request(request)
+
+    def close_idle(self):
+        while self.returned:
+            self.shutdown_request(self.returned.popleft()[0])
+        for request in list(self.idle):
+            self.drop_idle(request)
+        while self.waiting:
+            self.shutdown_request(self.waiting.popleft()[0])
+
+    def dispatch_waiting(self):
+        """Hand readable connections to free workers; the rest wait for
+        a worker to finish"""
+        while self.waiting and self.slots.acquire(blocking=False):
+            request, client_address, requests, _ = self.waiting.popleft()
+            try:
+                self.pool.submit(self.process_request_worker, request,
+                                 client_address, requests)
+            except RuntimeError:
+                # Pool already shut down
+                self.slots.release()
+                self.shutdown_request(request)
+
+    def process_request_worker(self, request, client_address, requests=0):
+        try:
+            self.parking[request] = requests
+            self.finish_request(request, client_address)
+        except Exception:
+            self.parking.pop(request, None)
+            self.handle_error(request, client_address)
+        finally:
+            self.slots.release()
+            # The handler leaves ``parking`` set only if the connection stays
+            requests = self.parking.pop(request, None)
+            if requests is not None and not self.closing:
+                self.return_idle(request, client_address, requests)
+            else:
+                self.shutdown_request(request)
+                self.wake()
+
+    def shutdown(self):
+        """Stop ``serve_forever`` and wait for it to return"""
+        self.closing = True
+        self.wake()
+        self.stopped.wait()
+
+    def server_close(self):
+        """Close the listening socket and every idle connection"""
+        self.closing = True
+        self.wake()
+        self.stopped.wait(5)
+        super().server_close()
+        self.close_idle()
+        self.selector.close()
+        self.wakeup_r.close()
+        self.wakeup_w.close()
+        self.pool.shutdown(wait=False)
+
+
 class FileServer:
-    """Manages the HTTP file server"""
+    """Manages the HTTP file server.
 
-    def __init__(self, share_path, port, password=None, activity_callback=None):
+    ``ready`` is a future resolved by ``start``: the port once the socket
+    is listening, or the error that kept the server from starting.  Given
+    ``sock`` (see ``ports.acquire_socket``), the server serves on it and
+    closes it on ``stop``; ``port`` is then taken from the socket.
+    """
+
+    def __init__(self, share_path, port=None, password=None, activity_callback=None,
+                 workers=None, engine=None, transport_profile=None, sock=None):
         self.share_path = Path(share_path)
-        self.port = port
+        self.sock = sock
+        self.port = socket_port(sock) if sock else port
+        self.workers = workers
+        self.engine = engine or config.SERVER_ENGINE
         self.password = password
         self.activity_callback = activity_callback
         self.server = None
         self.server_thread = None
         self.running = False
-        self.original_dir = os.getcwd()
-
-        # Set class variables for handler
-        CustomHTTPRequestHandler.share_path = str(self.share_path)
-        CustomHTTPRequestHandler.password = password
-        CustomHTTPRequestHandler.activity_callback = activity_callback
+        self.ready = Future()
+        self.bandwidth_tracker = BandwidthTracker()
+        self.transport = TransportTuner(transport_profile)
+        self.reaper = Reaper()
 
     def start(self):
         """Start the HTTP server"""
+        self.ready = Future()
         try:
-            # Change to the directory to serve
             if self.share_path.is_file():
                 # If it's a file, serve its parent directory
-                os.chdir(self.share_path.parent)
+                directory = self.share_path.parent
             else:
                 # If it's a directory, serve it
-                os.chdir(self.share_path)
+                directory = self.share_path
+            # Paths are resolved against this root; the process cwd is untouched
+            directory = directory.resolve()
 
-            self.server = socketserver.TCPServer(
-                ("", self.port),
-                CustomHTTPRequestHandler
-            )
-            self.server.allow_reuse_address = True
+            if self.engine == 'asyncio':
+                self.server = AsyncHTTPServer(
+                    ("", self.port),
+                    directory,
+                    password=self.password,
+                    activity_callback=self.activity_callback,
+                    tracker=self.bandwidth_tracker,
+                    encoded_cache=shared_encoded_cache,
+                    listing_cache=listing_cache,
+                    block_cache=shared_block_cache,
+                    transport=self.transport,
+                    reaper=self.reaper,
+                    sock=self.sock
+                )
+            else:
+                self.server = PooledHTTPServer(
+                    ("", self.port),
+                    functools.partial(CustomHTTPRequestHandler, directory=str(directory)),
+                    workers=self.workers,
+                    password=self.password,
+                    activity_callback=self.activity_callback,
+                    tracker=self.bandwidth_tracker,
+                    transport=self.transport,
+                    reaper=self.reaper,
+                    sock=self.sock
+                )
 
             self.running = True
             self.server_thread = threading.Thread(
@@ -149,12 +759,17 @@ class FileServer:
             self.server_thread.daemon = True
             self.server_thread.start()
 
-            print(f"Server started on port {self.port}")
+            print(f"Server started on port {self.port} ({self.engine})")
             print(f"Serving: {self.share_path}")
+            # Both engines listen from construction; early connections
+            # wait in the backlog for the serving thread
+            self.ready.set_result(self.port)
             return True
         except Exception as e:
             print(f"Error starting server: {e}")
-            os.chdir(self.original_dir)
+            if self.sock:
+                self.sock.close()
+            self.ready.set_exception(e)
             return False
 
     def stop(self):
@@ -163,13 +778,18 @@ class FileServer:
             self.running = False
             self.server.shutdown()
             self.server.server_close()
-            os.chdir(self.original_dir)
             print("Server stopped")
 
     def get_bandwidth_stats(self):
-        """Get current bandwidth statistics"""
-        return CustomHTTPRequestHandler.bandwidth_tracker.get_stats()
+        """Get current bandwidth statistics, with the socket tuning in effect,
+        the (process-wide) block cache's hit rate and memory use and the
+        connections dropped for breaking a time limit"""
+        stats = self.bandwidth_tracker.get_stats()
+        stats['transport'] = self.transport.stats()
+        stats['block_cache'] = shared_block_cache.stats()
+        stats['reaper'] = self.reaper.stats()
+        return stats
 
     def reset_bandwidth_stats(self):
         """Reset bandwidth statistics"""
-        CustomHTTPRequestHandler.bandwidth_tracker.reset()
+        self.bandwidth_tracker.reset()
@@ -0,0 +1,144 @@
+"""
+Start/stop lifecycle of the server behind a SecureShare Pro share
+"""
+
+import socket
+import threading
+from concurrent.futures import Future
+
+from werkzeug.serving import ThreadedWSGIServer
+
+from ports import acquire_socket, socket_port
+from prefork import PreforkServer, log
+
+# How often the accept loop checks for stop(); it bounds how long stopping
+# (and so restarting) a share waits for the loop to notice
+POLL_INTERVAL = 0.05
+
+
+class StoppableWSGIServer(ThreadedWSGIServer):
+    """werkzeug's threaded server that can drop the connections it holds"""
+
+    def __init__(self, *args, **kwargs):
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def process_request(self, request, client_address):
+        with self.connections_lock:
+            self.connections.add(request)
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request):
+        with self.connections_lock:
+            self.connections.discard(request)
+        super().shutdown_request(request)
+
+    def close_connections(self):
+        """Cut off every client still connected (their threads then exit)"""
+        with self.connections_lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def failed(error):
+    future = Future()
+    future.set_exception(error)
+    return future
+
+
+class ShareServer:
+    """Serves a WSGI app for one share at a time, for as long as the GUI runs.
+
+    ``acquire`` binds the share's port and ``start`` serves the app on that
+    socket, from threads in this process or from pre-forked worker
+    processes; ``stop`` closes the socket, drops open connections and joins
+    the serving thread, so nothing outlives the share and the next share
+    can bind the same port again straight away.
+
+    ``start`` does not block on the server coming up: it returns a future
+    that resolves to the port once connections are being accepted, or
+    holds the error (a taken port, workers that never start).
+    """
+
+    def __init__(self, app, host='0.0.0.0', request_handler=None):
+        self.app = app
+        self.host = host
+        self.request_handler = request_handler
+        self.server = None
+        self.thread = None
+        self.workers = None
+        self.port = None
+        self.starts = 0
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.server is not None or self.workers is not None
+
+    def acquire(self, preferred=None, port_range=None):
+        """Bind and listen on a port for ``start`` (see
+        ``ports.acquire_socket``); pre-forked workers all accept from this
+        one socket, so no other share can bind the port alongside it"""
+        return acquire_socket(preferred, port_range, self.host)
+
+    def start(self, sock, workers=1, on_exit=None):
+        """Serve on ``sock``, from ``acquire``, which this server then owns
+        and closes on ``stop``; returns the readiness future"""
+        with self.lock:
+            if self.running:
+                sock.close()
+                raise RuntimeError("share server is already running")
+            port = socket_port(sock)
+            if workers > 1:
+                workers = PreforkServer(self.app, self.host, port, workers,
+                                        self.request_handler, on_exit=on_exit,
+                                        sock=sock)
+                try:
+                    workers.start()
+                except OSError as e:
+                    workers.stop()
+                    return failed(e)
+                self.workers = workers
+                ready = workers.ready
+            else:
+                # werkzeug serves a copy of the socket, already listening;
+                # connections wait in the backlog until the thread picks
+                # them up
+                with sock:
+                    self.server = StoppableWSGIServer(
+                        self.host, port, self.app, self.request_handler,
+                        fd=sock.fileno())
+                self.thread = threading.Thread(
+                    target=self.server.serve_forever, args=(POLL_INTERVAL,),
+                    name=f"ShareServer-{port}", daemon=True)
+                self.thread.start()
+                log(f"Serving on port {port}")
+                ready = Future()
+                ready.set_result(port)
+            self.port = port
+            self.starts += 1
+            return ready
+
+    def stop(self, timeout=5):
+        """Stop serving and release the port; safe to call when stopped"""
+        with self.lock:
+            if self.workers:
+                self.workers.stop(timeout)
+                self.workers = None
+            if self.server:
+                self.server.shutdown()
+                self.server.close_connections()
+                self.thread.join(timeout)
+                self.server = self.thread = None
+
+    def stats(self):
+        with self.lock:
+            stats = {'running': self.running, 'port': self.port, 'starts': self.starts}
+            if self.workers:
+                stats['prefork'] = self.workers.stats()
+            return stats
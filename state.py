@@ -0,0 +1,203 @@
+"""
+Share statistics (downloads, visitors, download log) for SecureShare Pro
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+
+import config
+
+# Stores to reset in forked children: connections, locks and unwritten
+# updates belong to the process that made them
+_stores = weakref.WeakSet()
+
+
+def _after_fork():
+    for store in list(_stores):
+        store.after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class LocalState:
+    """Statistics kept in this process's memory"""
+
+    def __init__(self):
+        self.downloads = 0
+        self.visitors = set()
+        self.entries = []
+        self.lock = threading.Lock()
+
+    def add_visitor(self, ip):
+        with self.lock:
+            self.visitors.add(ip)
+
+    def add_download(self, ip):
+        with self.lock:
+            self.downloads += 1
+            self.entries.append((ip, time.time()))
+
+    def stats(self):
+        with self.lock:
+            return {'downloads': self.downloads, 'users': len(self.visitors)}
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteState:
+    """Statistics shared by every process serving a share.
+
+    Each process batches its updates in memory and a background thread
+    writes them every ``STATE_FLUSH_INTERVAL`` seconds (sooner once
+    ``STATE_BATCH_SIZE`` are pending), one transaction per batch, so
+    readers never see half a batch.  The database is in WAL mode: readers
+    do not block writers, and the totals are kept in a one-row table so
+    ``stats`` is one row lookup however long the share runs.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='share-state-', suffix='.db')
+            os.close(fd)
+            self.owned = True
+        else:
+            self.owned = False
+        self.path = path
+        self.creator = os.getpid()
+        self.connection = None
+        self.inherited = []
+        self.pending = []
+        self.pending_visitors = set()
+        self.seen = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.flusher = None
+
+        with self.connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    downloads INTEGER NOT NULL,
+                    users INTEGER NOT NULL);
+                INSERT OR IGNORE INTO totals VALUES (0, 0, 0);
+                CREATE TABLE IF NOT EXISTS visitors (ip TEXT PRIMARY KEY);
+                CREATE TABLE IF NOT EXISTS downloads (
+                    id INTEGER PRIMARY KEY, ip TEXT, at REAL);
+            """)
+        _stores.add(self)
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(
+                self.path, timeout=10, check_same_thread=False,
+                isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+        return self.connection
+
+    def after_fork(self):
+        if self.connection is not None:
+            # Closing the parent's connection here would drop this
+            # process's own locks on the database, so it is kept unused
+            self.inherited.append(self.connection)
+            self.connection = None
+        self.pending = []
+        self.pending_visitors = set()
+        self.seen = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.flusher = None
+
+    def queue(self):
+        """Start this process's flusher thread on its first update"""
+        if self.flusher is None:
+            self.flusher = threading.Thread(target=self.run_flusher, daemon=True)
+            self.flusher.start()
+        if len(self.pending) + len(self.pending_visitors) >= config.STATE_BATCH_SIZE:
+            self.wakeup.set()
+
+    def add_visitor(self, ip):
+        with self.lock:
+            if ip in self.seen:
+                return
+            self.seen.add(ip)
+            self.pending_visitors.add(ip)
+            self.queue()
+
+    def add_download(self, ip):
+        with self.lock:
+            self.pending.append((ip, time.time()))
+            self.queue()
+
+    def run_flusher(self):
+        while True:
+            self.wakeup.wait(config.STATE_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Failed to save share statistics: {e}")
+
+    def flush(self):
+        """Write the pending updates in one transaction"""
+        with self.lock:
+            if not self.pending and not self.pending_visitors:
+                return
+            downloads, visitors = self.pending, self.pending_visitors
+            conn = self.connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                added = conn.executemany(
+                    'INSERT OR IGNORE INTO visitors VALUES (?)',
+                    [(ip,) for ip in visitors]).rowcount if visitors else 0
+                conn.executemany('INSERT INTO downloads (ip, at) VALUES (?, ?)', downloads)
+                conn.execute(
+                    'UPDATE totals SET downloads = downloads + ?, users = users + ?',
+                    (len(downloads), max(added, 0)))
+                conn.execute('COMMIT')
+            except sqlite3.Error:
+                conn.execute('ROLLBACK')
+                raise
+            self.pending = []
+            self.pending_visitors = set()
+
+    def stats(self):
+        with self.lock:
+            downloads, users = self.connect().execute(
+                'SELECT downloads, users FROM totals').fetchone()
+            # Unwritten visitors may already be counted by another process;
+            # the next flush settles it
+            return {'downloads': downloads + len(self.pending),
+                    'users': users + len(self.pending_visitors)}
+
+    def close(self):
+        """Write what is pending and, for a temporary database, delete it"""
+        self.flush()
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+        if self.owned and os.getpid() == self.creator:
+            for suffix in ('', '-wal', '-shm'):
+                try:
+                    os.remove(self.path + suffix)
+                except OSError:
+                    pass
+
+
+def open_state(workers=1):
+    """The statistics store for a share served by ``workers`` processes"""
+    backend = config.STATE_BACKEND
+    if backend == 'auto':
+        backend = 'sqlite' if workers > 1 else 'local'
+    return SQLiteState() if backend == 'sqlite' else LocalState()
@@ -0,0 +1,62 @@
+"""
+Streamed ZIP archives built with the compression process pool
+"""
+
+import io
+import os
+import signal
+import zipfile
+
+import pytest
+
+import archive
+import config
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'ARCHIVE_BLOCK_SIZE', 256 * 1024)
+    paths = []
+    for i in range(3):
+        path = tmp_path / f'part{i}.txt'
+        path.write_bytes(b''.join(b'row %d of part %d\n' % (n, i) for n in range(150000)))
+        paths.append(str(path))
+    yield paths
+    archive.shutdown_compression_pool()
+
+
+def check_archive(data, files):
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        assert z.testzip() is None
+        for info, path in zip(z.infolist(), files):
+            assert info.compress_type == zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as f:
+                assert z.read(info) == f.read()
+
+
+def test_parallel_archive(files):
+    check_archive(b''.join(archive.ZipStream(files, workers=2)), files)
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason="needs SIGKILL")
+def test_broken_pool_falls_back_to_serial(files):
+    stream = iter(archive.ZipStream(files, workers=2))
+    chunks = [next(stream)]
+    pool = archive.get_compression_pool(2)
+    for process in list(pool._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+    chunks.extend(stream)
+
+    check_archive(b''.join(chunks), files)
+    # The broken pool is replaced for the next archive
+    assert archive.get_compression_pool(2) is not pool
+    check_archive(b''.join(archive.ZipStream(files, workers=2)), files)
+
+
+def test_pool_that_cannot_start_falls_back_to_serial(files, monkeypatch):
+    class Unstartable:
+        def submit(self, *args):
+            raise AssertionError("daemonic processes are not allowed to have children")
+
+    monkeypatch.setattr(archive, 'get_compression_pool', lambda workers: Unstartable())
+    check_archive(b''.join(archive.ZipStream(files, workers=2)), files)
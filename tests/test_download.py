@@ -0,0 +1,128 @@
+"""
+Archive downloads from the Flask app: /download and /download/selected
+"""
+
+import io
+import os
+import time
+import zipfile
+
+import pytest
+
+import config
+from archive_cache import ArchiveCache
+
+
+@pytest.fixture
+def share(tmp_path, monkeypatch):
+    import main
+    files = []
+    for i in range(3):
+        # Incompressible, so 'auto' mode picks the store-only layout
+        path = tmp_path / f'part{i}.bin'
+        path.write_bytes(os.urandom(300 * 1024))
+        files.append(str(path))
+    monkeypatch.setattr(config, 'ZIP_RESUMABLE_MODE', 'auto')
+    monkeypatch.setattr(main, 'archive_cache', ArchiveCache(tmp_path / 'archives'))
+    monkeypatch.setitem(main.app_data, 'files', files)
+    monkeypatch.setitem(main.app_data, 'file_ids', main.index_files(files))
+    monkeypatch.setitem(main.app_data, 'archive_format', 'zip')
+    monkeypatch.setitem(main.app_data, 'password_hash', None)
+    return main, files
+
+
+def check_archive(data, files):
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        assert z.testzip() is None
+        assert [z.read(info) for info in z.infolist()] == [
+            open(path, 'rb').read() for path in files]
+
+
+def wait_for_build(cache, files):
+    deadline = time.monotonic() + 10
+    while not cache.find(files).ok and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return cache.find(files)
+
+
+def test_layout_is_prepared_in_background(share):
+    main, files = share
+    client = main.app.test_client()
+
+    # The first request is streamed instead of waiting for the checksums
+    response = client.get('/download')
+    assert response.status_code == 200
+    assert 'Accept-Ranges' not in response.headers
+    check_archive(response.get_data(), files)
+
+    layout = main.archive_cache.get_layout(files)
+    layout.thread.join(10)
+    assert layout.ready
+    response = client.get('/download', headers={'Range': 'bytes=0-99'})
+    assert response.status_code == 206
+    assert len(response.get_data()) == 100
+
+
+def test_selected_layout_is_cached(share):
+    main, files = share
+    client = main.app.test_client()
+    ids = [main.file_id(path) for path in files[:2]]
+    query = '&'.join(f'id={fid}' for fid in ids)
+
+    check_archive(client.get(f'/download/selected?{query}').get_data(), files[:2])
+    layout = main.archive_cache.get_layout(files[:2])
+    layout.thread.join(10)
+    assert layout.ready
+    response = client.get(f'/download/selected?{query}')
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    check_archive(response.get_data(), files[:2])
+    assert main.archive_cache.get_layout(files[:2]) is layout
+
+
+def test_head_does_not_start_a_build(share, monkeypatch):
+    main, files = share
+    monkeypatch.setattr(config, 'ZIP_RESUMABLE_MODE', 'never')
+    monkeypatch.setattr(config, 'ARCHIVE_WORKERS', 1)
+    client = main.app.test_client()
+
+    response = client.head('/download')
+    assert response.status_code == 200
+    assert 'Content-Length' not in response.headers
+    assert main.archive_cache.find(files) is None
+    assert not main.archive_cache.builds
+
+    check_archive(client.get('/download').get_data(), files)
+    build = wait_for_build(main.archive_cache, files)
+    response = client.head('/download')
+    assert response.status_code == 200
+    assert int(response.headers['Content-Length']) == build.path.stat().st_size
+
+
+def test_etag_survives_the_build_finishing(share, monkeypatch):
+    main, files = share
+    monkeypatch.setattr(config, 'ZIP_RESUMABLE_MODE', 'never')
+    monkeypatch.setattr(config, 'ARCHIVE_WORKERS', 1)
+    client = main.app.test_client()
+
+    building = client.get('/download')
+    etag = building.headers['ETag']
+    check_archive(building.get_data(), files)
+    wait_for_build(main.archive_cache, files)
+
+    built = client.get('/download')
+    assert built.headers['ETag'] == etag
+    assert built.headers['Accept-Ranges'] == 'bytes'
+    assert client.get('/download', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_layout_etag_matches_the_stream_it_replaces(share):
+    main, files = share
+    client = main.app.test_client()
+
+    streamed = client.get('/download')
+    assert streamed.headers['ETag'].startswith('W/')
+    main.archive_cache.get_layout(files).thread.join(10)
+    laid_out = client.get('/download')
+    assert laid_out.headers['ETag'] == streamed.headers['ETag'][2:]
+    response = client.get('/download', headers={'If-None-Match': streamed.headers['ETag']})
+    assert response.status_code == 304
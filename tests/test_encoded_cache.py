@@ -0,0 +1,26 @@
+"""
+Bookkeeping of the precompressed-variant cache
+"""
+
+import os
+
+import config
+from encoded_cache import EncodedCache
+
+
+def test_probe_verdicts_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'ENCODED_PROBE_CACHE_SIZE', 3)
+    cache = EncodedCache(tmp_path / 'encoded')
+    paths = []
+    for i in range(5):
+        path = tmp_path / f'log{i}.txt'
+        path.write_bytes(b'compressible line\n' * 1000)
+        paths.append(str(path))
+        assert cache.should_encode(paths[-1], os.stat(paths[-1]))
+
+    # Touching the oldest verdict keeps it over the next-oldest
+    cache.should_encode(paths[2], os.stat(paths[2]))
+    cache.should_encode(paths[0], os.stat(paths[0]))
+    assert len(cache.compressible) == 3
+    kept = {identity[0] for identity in cache.compressible}
+    assert kept == {os.path.abspath(p) for p in (paths[4], paths[2], paths[0])}
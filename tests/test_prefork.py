@@ -0,0 +1,59 @@
+"""
+Downloads served by pre-forked worker processes
+"""
+
+import http.client
+import io
+import zipfile
+
+import pytest
+
+import config
+from prefork import PREFORK_OK, PreforkServer
+
+pytestmark = pytest.mark.skipif(not PREFORK_OK, reason="needs os.fork")
+
+
+@pytest.fixture
+def share(tmp_path, monkeypatch):
+    import main
+    files = []
+    for i in range(3):
+        path = tmp_path / f'part{i}.txt'
+        path.write_bytes(b''.join(b'line %d of part %d\n' % (n, i) for n in range(200000)))
+        files.append(str(path))
+    # Deflated in a process pool: the ZIP is streamed, not laid out
+    monkeypatch.setattr(config, 'ARCHIVE_WORKERS', 2)
+    monkeypatch.setattr(config, 'ZIP_RESUMABLE_MODE', 'never')
+    monkeypatch.setattr(config, 'ARCHIVE_CACHE_DIR', tmp_path / 'archives')
+    monkeypatch.setitem(main.app_data, 'files', files)
+    monkeypatch.setitem(main.app_data, 'file_ids', main.index_files(files))
+    monkeypatch.setitem(main.app_data, 'archive_format', 'zip')
+    monkeypatch.setitem(main.app_data, 'password_hash', None)
+    return main.app, files
+
+
+def test_deflated_download_from_worker(share):
+    from ports import acquire_socket
+    app, files = share
+    sock = acquire_socket(host='127.0.0.1')
+    port = sock.getsockname()[1]
+    server = PreforkServer(app, '127.0.0.1', port, workers=2, sock=sock)
+    server.start()
+    try:
+        assert server.ready.result(10) == port
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.request('GET', '/download')
+        response = conn.getresponse()
+        body = response.read()
+        conn.close()
+    finally:
+        server.stop()
+
+    assert response.status == 200
+    archive = zipfile.ZipFile(io.BytesIO(body))
+    assert archive.testzip() is None
+    for info, path in zip(archive.infolist(), files):
+        assert info.compress_type == zipfile.ZIP_DEFLATED
+        with open(path, 'rb') as f:
+            assert archive.read(info) == f.read()
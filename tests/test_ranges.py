@@ -0,0 +1,210 @@
+"""
+Range / If-Range handling of both FileServer engines and the Flask app
+"""
+
+import hashlib
+import http.client
+import os
+import random
+
+import pytest
+
+import http_utils
+from http_utils import RangeNotSatisfiable, coalesce_ranges, parse_range_header
+
+FILE_SIZE = 3 * 1024 * 1024 + 12345
+SEGMENTS = 24
+
+
+# -- parse_range_header / coalesce_ranges ------------------------------------
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    ('items=0-10', None),
+    ('bytes=abc', None),
+    ('bytes=5-2', None),
+    ('bytes=-', None),
+    ('bytes=0-0', [(0, 1)]),
+    ('bytes=0-99', [(0, 100)]),
+    ('bytes=990-', [(990, 1000)]),
+    ('bytes=-10', [(990, 1000)]),
+    ('bytes=-5000', [(0, 1000)]),
+    ('bytes=900-5000', [(900, 1000)]),
+    ('BYTES = 0-9', [(0, 10)]),
+    ('bytes=0-9, 2000-3000', [(0, 10)]),
+    ('bytes=-0, 0-9', [(0, 10)]),
+    ('bytes=500-599,0-99', [(500, 600), (0, 100)]),
+    ('bytes=0-99,50-149', [(0, 150)]),
+    ('bytes=0-99,100-199', [(0, 100), (100, 200)]),
+])
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, 1000) == expected
+
+
+@pytest.mark.parametrize('header', ['bytes=1000-', 'bytes=5000-6000', 'bytes=-0', 'bytes=1000-1000,2000-'])
+def test_parse_range_header_unsatisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header(header, 1000)
+
+
+def test_parse_range_header_empty_resource():
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header('bytes=0-', 0)
+
+
+def test_coalesce_keeps_disjoint_order():
+    ranges = [(50, 60), (0, 10), (20, 30)]
+    assert coalesce_ranges(ranges, max_ranges=16) == ranges
+
+
+def test_coalesce_merges_overlapping_and_adjacent():
+    assert coalesce_ranges([(20, 30), (0, 10), (5, 20)], max_ranges=16) == [(0, 30)]
+
+
+def test_coalesce_collapses_too_many_ranges():
+    ranges = [(i * 10, i * 10 + 1) for i in range(20)]
+    assert coalesce_ranges(ranges, max_ranges=16) == [(0, 191)]
+
+
+def test_if_range_matches():
+    etag, mtime = '"abc"', 1700000000
+    assert http_utils.if_range_matches(None, etag, mtime)
+    assert http_utils.if_range_matches('"abc"', etag, mtime)
+    assert not http_utils.if_range_matches('"other"', etag, mtime)
+    assert not http_utils.if_range_matches('W/"abc"', etag, mtime)
+    assert http_utils.if_range_matches(http_utils.http_date(mtime), etag, mtime)
+    assert not http_utils.if_range_matches(http_utils.http_date(mtime - 60), etag, mtime)
+
+
+# -- segmented downloads against the servers ----------------------------------
+
+@pytest.fixture(scope='module')
+def shared_file(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('share')
+    path = directory / 'payload.bin'
+    data = os.urandom(FILE_SIZE)
+    path.write_bytes(data)
+    return path, data
+
+
+def socket_fetcher(port, url):
+    def fetch(headers=None, method='GET'):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        try:
+            conn.request(method, url, headers=headers or {})
+            response = conn.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            conn.close()
+    return fetch
+
+
+@pytest.fixture(params=['threaded', 'asyncio', 'flask'])
+def fetch(request, shared_file):
+    path, _ = shared_file
+    if request.param == 'flask':
+        import main
+        main.app_data['files'] = [str(path)]
+        main.app_data['file_ids'] = main.index_files([str(path)])
+        main.app_data['password_hash'] = None
+        client = main.app.test_client()
+        url = f'/file/{main.file_id(str(path))}'
+
+        def fetch(headers=None, method='GET'):
+            response = client.open(url, method=method, headers=headers or {})
+            return response.status_code, dict(response.headers), response.get_data()
+        yield fetch
+        main.app_data['files'] = []
+        main.app_data['file_ids'] = {}
+        return
+
+    from ports import acquire_socket
+    from server import FileServer
+    server = FileServer(path.parent, engine=request.param,
+                        sock=acquire_socket(host='127.0.0.1'))
+    assert server.start()
+    yield socket_fetcher(server.ready.result(5), '/' + path.name)
+    server.stop()
+
+
+def header(headers, name):
+    return {k.lower(): v for k, v in headers.items()}.get(name.lower())
+
+
+def test_head_has_length_and_validators(fetch, shared_file):
+    status, headers, body = fetch(method='HEAD')
+    assert status == 200
+    assert body == b''
+    assert int(header(headers, 'Content-Length')) == FILE_SIZE
+    assert header(headers, 'Accept-Ranges') == 'bytes'
+    assert header(headers, 'ETag')
+
+
+def test_shuffled_segments_match_checksum(fetch, shared_file):
+    _, data = shared_file
+    _, headers, _ = fetch(method='HEAD')
+    etag = header(headers, 'ETag')
+
+    rng = random.Random(42)
+    cuts = sorted(rng.sample(range(1, FILE_SIZE), SEGMENTS - 1))
+    segments = list(zip([0] + cuts, cuts + [FILE_SIZE]))
+    rng.shuffle(segments)
+
+    assembled = bytearray(FILE_SIZE)
+    for start, stop in segments:
+        status, headers, body = fetch({'Range': f'bytes={start}-{stop - 1}', 'If-Range': etag})
+        assert status == 206
+        assert header(headers, 'Content-Range') == f'bytes {start}-{stop - 1}/{FILE_SIZE}'
+        assert len(body) == stop - start
+        assembled[start:stop] = body
+
+    assert hashlib.sha256(assembled).hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+def test_suffix_and_open_ended_ranges(fetch, shared_file):
+    _, data = shared_file
+    status, _, body = fetch({'Range': 'bytes=-1000'})
+    assert status == 206 and body == data[-1000:]
+    status, _, body = fetch({'Range': f'bytes={FILE_SIZE - 77}-'})
+    assert status == 206 and body == data[-77:]
+
+
+def test_multiple_ranges_are_multipart(fetch, shared_file):
+    _, data = shared_file
+    status, headers, body = fetch({'Range': 'bytes=100-199,5000-5099'})
+    assert status == 206
+    assert header(headers, 'Content-Type').startswith('multipart/byteranges')
+    assert data[100:200] in body and data[5000:5100] in body
+    assert int(header(headers, 'Content-Length')) == len(body)
+
+
+def test_stale_if_range_sends_whole_file(fetch, shared_file):
+    _, data = shared_file
+    status, _, body = fetch({'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert status == 200
+    assert hashlib.sha256(body).digest() == hashlib.sha256(data).digest()
+
+
+def test_unsatisfiable_range(fetch, shared_file):
+    status, headers, _ = fetch({'Range': f'bytes={FILE_SIZE}-'})
+    assert status == 416
+    assert header(headers, 'Content-Range') == f'bytes */{FILE_SIZE}'
+
+
+def test_range_bytes_tracked_exactly(shared_file):
+    from ports import acquire_socket
+    from server import FileServer
+    path, _ = shared_file
+    server = FileServer(path.parent, engine='asyncio', sock=acquire_socket(host='127.0.0.1'))
+    assert server.start()
+    try:
+        fetch = socket_fetcher(server.ready.result(5), '/' + path.name)
+        for size in (200000, 400000):
+            before = server.bandwidth_tracker.get_stats()['download_bytes']
+            status, _, body = fetch({'Range': f'bytes=0-{size - 1}'})
+            assert status == 206 and len(body) == size
+            tracked = server.bandwidth_tracker.get_stats()['download_bytes'] - before
+            assert tracked == size
+    finally:
+        server.stop()
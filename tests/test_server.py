@@ -0,0 +1,88 @@
+"""
+Connection handling of FileServer's worker pool under load
+"""
+
+import functools
+import http.client
+import socket
+import threading
+import time
+
+import pytest
+
+import config
+from server import CustomHTTPRequestHandler, PooledHTTPServer
+
+
+@pytest.fixture
+def pooled(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'HEADER_TIMEOUT', 1)
+    (tmp_path / 'hello.txt').write_bytes(b'hello')
+    servers = []
+
+    def start(**kwargs):
+        server = PooledHTTPServer(
+            ('127.0.0.1', 0),
+            functools.partial(CustomHTTPRequestHandler, directory=str(tmp_path)),
+            **kwargs)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def get(port, path='/hello.txt'):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def test_idle_connections_do_not_hold_workers(pooled):
+    server = pooled(workers=2)
+    port = server.server_address[1]
+    idle = []
+    for _ in range(4):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        conn.request('GET', '/hello.txt')
+        assert conn.getresponse().read() == b'hello'
+        idle.append(conn)
+
+    started = time.monotonic()
+    assert get(port) == (200, b'hello')
+    assert time.monotonic() - started < 1
+    for conn in idle:
+        conn.close()
+
+
+def test_saturated_pool_stops_accepting_and_sheds_stalled_requests(pooled):
+    server = pooled(workers=2)
+    port = server.server_address[1]
+    # Each stalled request holds a worker or waits for one
+    clients = []
+    for _ in range(10):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(b'GET /hello.txt HTTP/1.1\r\n')
+        clients.append(sock)
+
+    time.sleep(0.5)
+    assert not server.accepting
+    # Two being read and two waiting; the rest stay in the kernel's
+    # listen backlog
+    assert len(server.waiting) == 2 and not server.idle
+
+    deadline = time.monotonic() + 15
+    while server.reaper.counts['header'] < len(clients) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert server.reaper.counts['header'] == len(clients)
+    assert not server.waiting
+    assert server.accepting
+    assert get(port) == (200, b'hello')
+    for sock in clients:
+        sock.close()
@@ -0,0 +1,21 @@
+"""
+Share statistics shared between worker processes
+"""
+
+import config
+from state import SQLiteState
+
+
+def test_stats_count_unwritten_updates(monkeypatch):
+    monkeypatch.setattr(config, 'STATE_FLUSH_INTERVAL', 3600)
+    state = SQLiteState()
+    try:
+        state.add_visitor('10.0.0.1')
+        state.add_visitor('10.0.0.2')
+        state.add_download('10.0.0.1')
+        assert state.stats() == {'downloads': 1, 'users': 2}
+        state.flush()
+        state.add_visitor('10.0.0.2')
+        assert state.stats() == {'downloads': 1, 'users': 2}
+    finally:
+        state.close()
@@ -0,0 +1,121 @@
+"""
+Socket-level transport tuning for SecureShare Pro's servers
+"""
+
+import socket
+import sys
+import threading
+
+import config
+
+# Linux values, for Pythons built without the constants
+TCP_CORK = getattr(socket, 'TCP_CORK', 3 if sys.platform.startswith('linux') else None)
+TCP_NOTSENT_LOWAT = getattr(socket, 'TCP_NOTSENT_LOWAT',
+                            25 if sys.platform.startswith('linux') else None)
+TCP_CONGESTION = getattr(socket, 'TCP_CONGESTION',
+                         13 if sys.platform.startswith('linux') else None)
+
+
+def available_congestion_controls():
+    """Congestion control algorithms the kernel offers (Linux only)"""
+    try:
+        with open('/proc/sys/net/ipv4/tcp_available_congestion_control') as f:
+            return f.read().split()
+    except OSError:
+        return []
+
+
+class TransportTuner:
+    """Apply one of ``config.TRANSPORT_PROFILES`` to accepted connections.
+
+    Options the platform lacks are skipped.  The values the kernel actually
+    granted (it clamps buffer sizes, for one) are read back from the first
+    tuned socket and reported by ``stats``.
+    """
+
+    def __init__(self, profile=None):
+        self.profile = profile or config.TRANSPORT_PROFILE
+        if self.profile not in config.TRANSPORT_PROFILES:
+            print(f"Unknown transport profile {self.profile!r}, using 'default'")
+            self.profile = 'default'
+        self.settings = config.TRANSPORT_PROFILES[self.profile]
+        self.effective = None
+        self.errors = {}
+        self.connections = 0
+        self.lock = threading.Lock()
+
+        congestion = self.settings.get('congestion')
+        available = available_congestion_controls()
+        if congestion and available and congestion not in available:
+            self.errors['congestion'] = (
+                f"{congestion!r} not available (kernel offers {', '.join(available)})")
+
+    def tune(self, sock):
+        """Apply the profile to a newly accepted TCP connection"""
+        settings = self.settings
+        options = []
+        if settings.get('sndbuf'):
+            options.append(('sndbuf', socket.SOL_SOCKET, socket.SO_SNDBUF, settings['sndbuf']))
+        if settings.get('rcvbuf'):
+            options.append(('rcvbuf', socket.SOL_SOCKET, socket.SO_RCVBUF, settings['rcvbuf']))
+        if settings.get('nodelay'):
+            options.append(('nodelay', socket.IPPROTO_TCP, socket.TCP_NODELAY, 1))
+        if settings.get('notsent_lowat') and TCP_NOTSENT_LOWAT is not None:
+            options.append(('notsent_lowat', socket.IPPROTO_TCP, TCP_NOTSENT_LOWAT,
+                            settings['notsent_lowat']))
+        if (settings.get('congestion') and TCP_CONGESTION is not None
+                and 'congestion' not in self.errors):
+            options.append(('congestion', socket.IPPROTO_TCP, TCP_CONGESTION,
+                            settings['congestion'].encode('ascii')))
+
+        for name, level, option, value in options:
+            try:
+                sock.setsockopt(level, option, value)
+            except OSError as e:
+                with self.lock:
+                    self.errors[name] = str(e)
+
+        with self.lock:
+            self.connections += 1
+            if self.effective is None:
+                self.effective = self.read_back(sock)
+
+    def read_back(self, sock):
+        """Socket options as the kernel reports them"""
+        values = {}
+        try:
+            values['sndbuf'] = sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+            values['rcvbuf'] = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+            values['nodelay'] = bool(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+            if TCP_NOTSENT_LOWAT is not None:
+                values['notsent_lowat'] = sock.getsockopt(socket.IPPROTO_TCP, TCP_NOTSENT_LOWAT)
+            if TCP_CONGESTION is not None:
+                raw = sock.getsockopt(socket.IPPROTO_TCP, TCP_CONGESTION, 16)
+                values['congestion'] = raw.split(b'\0', 1)[0].decode('ascii')
+        except OSError:
+            pass
+        return values
+
+    def cork(self, sock, on=True):
+        """Hold back partial segments (headers) until ``cork(sock, False)``.
+
+        Lets response headers and the start of the body, including data
+        sent with sendfile, share full segments.  A no-op where TCP_CORK
+        does not exist.
+        """
+        if not self.settings.get('cork') or TCP_CORK is None:
+            return
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, TCP_CORK, 1 if on else 0)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                'profile': self.profile,
+                'connections': self.connections,
+                'requested': dict(self.settings),
+                'effective': dict(self.effective or {}),
+                'errors': dict(self.errors),
+            }
@@ -23,19 +23,6 @@ def get_local_ip():
         return "127.0.0.1"
 
 
-def find_free_port(start_port=None):
-    """Find an available port to use"""
-    start = start_port or config.DEFAULT_PORT
-    for port in range(start, start + 100):
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.bind(('', port))
-                return port
-        except OSError:
-            continue
-    return None
-
-
 def generate_qr_code(url, size=300):
     """Generate QR code for the given URL"""
     qr = qrcode.QRCode(